@@ -26,6 +26,12 @@ from cloudkitty.common import policy
 from cloudkitty.db import api as db_api
 
 
+def notify_refresh():
+    client = pecan.request.rpc_client.prepare(namespace='collector',
+                                              fanout=True)
+    client.cast({}, 'refresh')
+
+
 class MappingController(rest.RestController):
     """REST Controller managing service to collector mappings."""
 
@@ -73,6 +79,7 @@ class MappingController(rest.RestController):
         """
         policy.enforce(pecan.request.context, 'collector:manage_mapping', {})
         new_mapping = self._db.set_mapping(service, collector)
+        notify_refresh()
         return collector_models.ServiceToCollectorMapping(
             service=new_mapping.service,
             collector=new_mapping.collector)
@@ -90,6 +97,7 @@ class MappingController(rest.RestController):
             self._db.delete_mapping(service)
         except db_api.NoSuchMapping as e:
             pecan.abort(404, six.text_type(e))
+        notify_refresh()
 
 
 class CollectorStateController(rest.RestController):
@@ -124,6 +132,7 @@ class CollectorStateController(rest.RestController):
         policy.enforce(pecan.request.context, 'collector:update_state', {})
         enabled = self._db.set_state('collector_{}'.format(name),
                                      infos.enabled)
+        notify_refresh()
         collector = collector_models.CollectorInfos(name=name,
                                                     enabled=enabled)
         return collector
@@ -25,7 +25,6 @@ import wsmeext.pecan as wsme_pecan
 
 from cloudkitty.api.v1.datamodels import storage as storage_models
 from cloudkitty.common import policy
-from cloudkitty import storage as ck_storage
 from cloudkitty import utils as ck_utils
 
 
@@ -36,14 +35,19 @@ class DataFramesController(rest.RestController):
                          datetime.datetime,
                          datetime.datetime,
                          wtypes.text,
-                         wtypes.text)
-    def get_all(self, begin, end, tenant_id=None, resource_type=None):
+                         wtypes.text,
+                         int,
+                         int)
+    def get_all(self, begin, end, tenant_id=None, resource_type=None,
+                limit=None, marker=None):
         """Return a list of rated resources for a time period and a tenant.
 
         :param begin: Start of the period
         :param end: End of the period
         :param tenant_id: UUID of the tenant to filter on.
         :param resource_type: Type of the resource to filter on.
+        :param limit: Maximum number of stored frames to return.
+        :param marker: Marker returned with the previous page.
         :return: Collection of DataFrame objects.
         """
 
@@ -53,34 +57,41 @@ class DataFramesController(rest.RestController):
         end_ts = ck_utils.dt2ts(end)
         backend = pecan.request.storage_backend
         dataframes = []
-        try:
-            frames = backend.get_time_frame(begin_ts,
-                                            end_ts,
-                                            tenant_id=tenant_id,
-                                            res_type=resource_type)
-            for frame in frames:
-                for service, data_list in frame['usage'].items():
-                    frame_tenant = None
-                    resources = []
-                    for data in data_list:
-                        desc = data['desc'] if data['desc'] else {}
-                        price = decimal.Decimal(str(data['rating']['price']))
-                        resource = storage_models.RatedResource(
-                            service=service,
-                            desc=desc,
-                            volume=data['vol']['qty'],
-                            rating=price)
-                        frame_tenant = data['tenant_id']
-                        resources.append(resource)
-                    dataframe = storage_models.DataFrame(
-                        begin=ck_utils.iso2dt(frame['period']['begin']),
-                        end=ck_utils.iso2dt(frame['period']['end']),
-                        tenant_id=frame_tenant,
-                        resources=resources)
-                    dataframes.append(dataframe)
-        except ck_storage.NoTimeFrame:
-            pass
-        return storage_models.DataFrameCollection(dataframes=dataframes)
+        frames = backend.iter_grouped_time_frame(begin_ts,
+                                                 end_ts,
+                                                 limit=limit,
+                                                 marker=marker,
+                                                 tenant_id=tenant_id,
+                                                 res_type=resource_type)
+        # The limit applies to stored resources, not to grouped frames
+        resources_count = 0
+        for marker, frame in frames:
+            frame_begin = ck_utils.iso2dt(frame['period']['begin'])
+            frame_end = ck_utils.iso2dt(frame['period']['end'])
+            for service, data_list in frame['usage'].items():
+                frame_tenant = None
+                resources = []
+                for data in data_list:
+                    desc = data['desc'] if data['desc'] else {}
+                    price = decimal.Decimal(str(data['rating']['price']))
+                    resource = storage_models.RatedResource(
+                        service=service,
+                        desc=desc,
+                        volume=data['vol']['qty'],
+                        rating=price)
+                    frame_tenant = data['tenant_id']
+                    resources.append(resource)
+                resources_count += len(resources)
+                dataframe = storage_models.DataFrame(
+                    begin=frame_begin,
+                    end=frame_end,
+                    tenant_id=frame_tenant,
+                    resources=resources)
+                dataframes.append(dataframe)
+        collection = storage_models.DataFrameCollection(dataframes=dataframes)
+        if limit and resources_count == limit:
+            collection.next_marker = marker
+        return collection
 
 
 class StorageController(rest.RestController):
@@ -78,6 +78,9 @@ class DataFrameCollection(wtypes.Base):
 
     dataframes = [DataFrame]
 
+    next_marker = int
+    """Marker to request the next page, only set if the limit was reached."""
+
     @classmethod
     def sample(cls):
         sample = DataFrame.sample()
@@ -35,6 +35,10 @@ collect_opts = [
     cfg.IntOpt('wait_periods',
                default=2,
                help='Wait for N periods before collecting new data.'),
+    cfg.IntOpt('catchup_periods',
+               default=1,
+               help='Maximum number of periods prefetched in a single '
+                    'request when a tenant is late.'),
     cfg.ListOpt('services',
                 default=['compute',
                          'image',
@@ -106,6 +110,51 @@ class BaseCollector(object):
         month_start = ck_utils.get_month_start()
         return ck_utils.dt2ts(month_start)
 
+    def prefetch(self, resource, start, end, project_id=None):
+        """Retrieve data for several periods at once.
+
+        Collectors supporting it will serve the following calls to retrieve
+        for periods between start and end without querying their backend.
+
+        :param resource: Resource to prefetch.
+        :param start: Start of the first period.
+        :param end: End of the last period.
+        :param project_id: Project to prefetch data for.
+        """
+        pass
+
+    def clear_prefetched(self, project_id=None):
+        """Drop the data prefetched for a project.
+
+        Called once a project is processed, even if the periods prefetched
+        were not all retrieved.
+
+        :param project_id: Project to drop the data of.
+        """
+        pass
+
+    def refresh(self):
+        """Reload the configuration of the collector.
+
+        Called when collectors or service mappings are changed through the
+        API.
+        """
+        pass
+
+    def close(self):
+        """Release the resources held by the collector.
+
+        Called when the collector is disabled, it won't be used afterwards.
+        """
+        pass
+
+    def has_resource(self, resource):
+        """Return True if the collector can retrieve a resource.
+
+        :param resource: Name of the resource.
+        """
+        return hasattr(self, 'get_' + resource.replace('.', '_'))
+
     def retrieve(self, resource, start, end=None, project_id=None,
                  q_filter=None):
         trans_resource = 'get_'
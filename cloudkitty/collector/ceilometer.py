@@ -15,15 +15,62 @@
 #
 # @author: Stéphane Albert
 #
+import collections
+import copy
+import json
+import shelve
+import time
+
 from ceilometerclient import client as cclient
+import eventlet
+from eventlet import event
+from eventlet import semaphore
 from keystoneclient import auth as ks_auth
+from keystoneclient import exceptions as ks_exceptions
 from keystoneclient import session as ks_session
 from oslo_config import cfg
+from oslo_log import log as logging
+from requests import adapters
 
 from cloudkitty import collector
 from cloudkitty import utils as ck_utils
 
 CEILOMETER_COLLECTOR_OPTS = 'ceilometer_collector'
+ceilometer_collector_opts = [
+    cfg.IntOpt('cache_size',
+               default=10000,
+               help='Maximum number of resources details cached for each '
+                    'resource type, 0 means unbounded.'),
+    cfg.IntOpt('cache_ttl',
+               default=86400,
+               help='Number of seconds after which cached resources details '
+                    'are fetched again, 0 means never.'),
+    cfg.StrOpt('cache_path',
+               help='Path of a file used to keep resources details across '
+                    'restarts, details are only kept in memory if unset.'),
+    cfg.IntOpt('max_concurrent_requests',
+               default=10,
+               help='Maximum number of concurrent requests sent to '
+                    'ceilometer, also used as the connection pool size.'),
+    cfg.IntOpt('request_retries',
+               default=3,
+               help='Number of times a request failing with a connection '
+                    'error, a timeout or a server error is retried.'),
+    cfg.FloatOpt('retry_backoff',
+                 default=1.0,
+                 help='Seconds to wait before the first retry, doubled '
+                      'after every failed attempt.'),
+    cfg.BoolOpt('collect_all_projects',
+                default=False,
+                help='Query the statistics of every project at once for '
+                     'each meter and period, and share the result between '
+                     'tenants.'),
+    cfg.StrOpt('metrics_file',
+               help='Path of a JSON file with additional metric '
+                    'definitions, they override the default ones.'),
+]
+
+cfg.CONF.register_opts(ceilometer_collector_opts, CEILOMETER_COLLECTOR_OPTS)
 ks_session.Session.register_conf_options(
     cfg.CONF,
     CEILOMETER_COLLECTOR_OPTS)
@@ -32,6 +79,60 @@ ks_auth.register_conf_options(
     CEILOMETER_COLLECTOR_OPTS)
 CONF = cfg.CONF
 
+LOG = logging.getLogger(__name__)
+
+# Default metric definitions, keyed by service name:
+# meter: Name of the ceilometer meter.
+# unit: Unit of the collected quantities.
+# aggregate: (Optional) Statistic used as quantity, every resource counts as
+#            one if not set.
+# factor: (Optional) Conversion factor applied to the quantities.
+# resource_type: (Optional) Type used to cache and strip the resources
+#                details, defaults to the service name.
+# metadata: (Optional) Mapping of description keys to a list of candidate
+#           metadata keys, the transformer rules of resource_type are used
+#           if not set. Details stripped this way are cached apart from the
+#           ones of the other metrics sharing resource_type.
+METRICS = {
+    'compute': {
+        'meter': 'instance',
+        'unit': 'instance'},
+    'image': {
+        'meter': 'image.size',
+        'unit': 'image',
+        'aggregate': 'max'},
+    'volume': {
+        'meter': 'volume.size',
+        'unit': 'GB',
+        'aggregate': 'max'},
+    'network.bw.in': {
+        'meter': 'network.incoming.bytes',
+        'unit': 'MB',
+        'aggregate': 'max',
+        'factor': 1 / 1048576.0,
+        'resource_type': 'network.tap'},
+    'network.bw.out': {
+        'meter': 'network.outgoing.bytes',
+        'unit': 'MB',
+        'aggregate': 'max',
+        'factor': 1 / 1048576.0,
+        'resource_type': 'network.tap'},
+    'network.floating': {
+        'meter': 'ip.floating',
+        'unit': 'ip'},
+}
+
+# Number of (meter, period) results kept for cross-project collection
+CROSS_PROJECT_CACHE_SIZE = 64
+
+# Number of (period, project) resources listings kept
+RESOURCES_LISTING_CACHE_SIZE = 64
+
+# Errors which can be fixed by sending the request again
+RETRIABLE_ERRORS = (ks_exceptions.ConnectionError,
+                    ks_exceptions.RequestTimeout,
+                    ks_exceptions.HttpServerError)
+
 
 class ResourceNotFound(Exception):
     """Raised when the resource doesn't exist."""
@@ -43,28 +144,142 @@ class ResourceNotFound(Exception):
         self.resource_type = resource_type
 
 
+class MetricDefinitionError(Exception):
+    """Raised when a metric definition is invalid."""
+
+    def __init__(self, metric, reason):
+        super(MetricDefinitionError, self).__init__(
+            "Invalid definition of metric %s: %s" % (metric, reason))
+        self.metric = metric
+        self.reason = reason
+
+
+def load_metrics(path=None):
+    """Return the metric definitions, default and user-defined ones.
+
+    :param path: Path of a JSON file with additional definitions.
+    """
+    metrics = copy.deepcopy(METRICS)
+    if path:
+        with open(path) as metrics_file:
+            metrics.update(json.load(metrics_file))
+    for name, metric in metrics.items():
+        for key in ('meter', 'unit'):
+            if key not in metric:
+                raise MetricDefinitionError(name, 'missing %s' % key)
+        metric.setdefault('aggregate', None)
+        metric.setdefault('factor', 1)
+        metric.setdefault('resource_type', name)
+        metric.setdefault('metadata', None)
+    return metrics
+
+
 class CeilometerResourceCacher(object):
-    def __init__(self):
+    """Cache of resources details.
+
+    Every resource type is an LRU bounded to cache_size entries, entries
+    older than cache_ttl seconds are fetched again. When cache_path is set,
+    details are also saved on disk so a restarted collector starts warm.
+    """
+
+    def __init__(self, size=None, ttl=None, path=None):
+        collector_conf = CONF[CEILOMETER_COLLECTOR_OPTS]
+        self._size = collector_conf.cache_size if size is None else size
+        self._ttl = collector_conf.cache_ttl if ttl is None else ttl
+        path = collector_conf.cache_path if path is None else path
         self._resource_cache = {}
+        self._store = shelve.open(path) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _store_key(resource_type, resource_id):
+        return str('{}/{}'.format(resource_type, resource_id))
+
+    def _is_expired(self, timestamp):
+        return self._ttl and time.time() - timestamp >= self._ttl
+
+    def _lookup(self, resource_type, resource_id):
+        type_cache = self._resource_cache.setdefault(
+            resource_type,
+            collections.OrderedDict())
+        entry = type_cache.pop(resource_id, None)
+        if entry is None and self._store is not None:
+            entry = self._store.get(self._store_key(resource_type,
+                                                    resource_id))
+        if entry is None:
+            return None
+        if self._is_expired(entry[0]):
+            self._discard(resource_type, resource_id)
+            return None
+        # Reinsert the entry to mark it as the most recently used
+        type_cache[resource_id] = entry
+        self._evict(type_cache)
+        return entry
+
+    def _evict(self, type_cache):
+        while self._size and len(type_cache) > self._size:
+            type_cache.popitem(last=False)
+
+    def _discard(self, resource_type, resource_id):
+        self._resource_cache.get(resource_type, {}).pop(resource_id, None)
+        if self._store is not None:
+            self._store.pop(self._store_key(resource_type, resource_id),
+                            None)
 
     def add_resource_detail(self, resource_type, resource_id, resource_data):
-        if resource_type not in self._resource_cache:
-            self._resource_cache[resource_type] = {}
-        self._resource_cache[resource_type][resource_id] = resource_data
-        return self._resource_cache[resource_type][resource_id]
+        entry = (time.time(), resource_data)
+        type_cache = self._resource_cache.setdefault(
+            resource_type,
+            collections.OrderedDict())
+        type_cache.pop(resource_id, None)
+        type_cache[resource_id] = entry
+        self._evict(type_cache)
+        if self._store is not None:
+            self._store[self._store_key(resource_type, resource_id)] = entry
+        return resource_data
+
+    def find_resource_detail(self, resource_type, resource_id):
+        """Return the cached details of a resource, None if not cached."""
+        entry = self._lookup(resource_type, resource_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
 
     def has_resource_detail(self, resource_type, resource_id):
-        if resource_type in self._resource_cache:
-            if resource_id in self._resource_cache[resource_type]:
-                return True
-        return False
+        return self.find_resource_detail(resource_type,
+                                         resource_id) is not None
 
     def get_resource_detail(self, resource_type, resource_id):
-        try:
-            resource = self._resource_cache[resource_type][resource_id]
-            return resource
-        except KeyError:
+        entry = self._lookup(resource_type, resource_id)
+        if entry is None:
             raise ResourceNotFound(resource_type, resource_id)
+        return entry[1]
+
+    def get_resources_details(self, resource_type, resource_ids):
+        """Return the details of several resources at once.
+
+        :param resource_type: Type of the resources.
+        :param resource_ids: List of resources IDs.
+        :return: List of details, in the same order as resource_ids.
+        """
+        return [self.get_resource_detail(resource_type, resource_id)
+                for resource_id in resource_ids]
+
+    def get_stats(self):
+        """Return the cache hits and misses, and the cached entries count."""
+        entries = sum(len(type_cache)
+                      for type_cache in self._resource_cache.values())
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': entries}
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
 
 
 class CeilometerCollector(collector.BaseCollector):
@@ -78,7 +293,13 @@ class CeilometerCollector(collector.BaseCollector):
         self.t_ceilometer = self.transformers['CeilometerTransformer']
         self.t_cloudkitty = self.transformers['CloudKittyFormatTransformer']
 
+        self.metrics = load_metrics(
+            CONF[CEILOMETER_COLLECTOR_OPTS].metrics_file)
         self._cacher = CeilometerResourceCacher()
+        self._stats_cache = {}
+        self._resources_listings = collections.OrderedDict()
+        self._projects_stats = collections.OrderedDict()
+        self._projects_stats_pending = {}
 
         self.auth = ks_auth.load_from_conf_options(
             CONF,
@@ -87,10 +308,41 @@ class CeilometerCollector(collector.BaseCollector):
             CONF,
             CEILOMETER_COLLECTOR_OPTS,
             auth=self.auth)
+        max_requests = CONF[CEILOMETER_COLLECTOR_OPTS].max_concurrent_requests
+        pool_adapter = adapters.HTTPAdapter(pool_maxsize=max_requests)
+        self.session.session.mount('http://', pool_adapter)
+        self.session.session.mount('https://', pool_adapter)
+        self._requests_semaphore = semaphore.Semaphore(max_requests)
+        self._requests_pool = eventlet.GreenPool(max_requests)
         self._conn = cclient.get_client(
             '2',
             session=self.session)
 
+    def close(self):
+        self._cacher.close()
+        self.session.session.close()
+
+    def _request(self, func, *args, **kwargs):
+        """Send a request to ceilometer, retrying on transient errors.
+
+        The number of requests running at the same time is bounded by
+        max_concurrent_requests.
+        """
+        collector_conf = CONF[CEILOMETER_COLLECTOR_OPTS]
+        attempt = 0
+        while True:
+            try:
+                with self._requests_semaphore:
+                    return func(*args, **kwargs)
+            except RETRIABLE_ERRORS as e:
+                if attempt >= collector_conf.request_retries:
+                    raise
+                delay = collector_conf.retry_backoff * 2 ** attempt
+                attempt += 1
+                LOG.warn('Ceilometer request failed (%s), retrying in '
+                         '%.1f seconds.', e, delay)
+                eventlet.sleep(delay)
+
     def gen_filter(self, op='eq', **kwargs):
         """Generate ceilometer filter from kwargs."""
         q_filter = []
@@ -122,27 +374,114 @@ class CeilometerCollector(collector.BaseCollector):
         meta_filter = self.prepend_filter('metadata.', **kwargs)
         return self.gen_filter(op, **meta_filter)
 
+    def prefetch(self, resource, start, end, project_id=None):
+        if CONF[CEILOMETER_COLLECTOR_OPTS].collect_all_projects:
+            # Periods are already fetched once for every project
+            return
+        if resource not in self.metrics:
+            return
+        meter = self.metrics[resource]['meter']
+        stats = self.resources_stats(meter,
+                                     start,
+                                     end,
+                                     project_id,
+                                     period=self.period)
+        buckets = {}
+        for stat in stats:
+            bucket = ck_utils.dt2ts(ck_utils.iso2dt(stat.period_start))
+            buckets.setdefault(bucket, []).append(stat)
+        self._stats_cache[(meter, project_id)] = (start, end, buckets)
+
+    def _get_prefetched_stats(self, meter, start, end, project_id):
+        cache_key = (meter, project_id)
+        if cache_key not in self._stats_cache:
+            return None
+        cache_start, cache_end, buckets = self._stats_cache[cache_key]
+        if end != start + self.period:
+            return None
+        if not cache_start <= start < cache_end:
+            return None
+        # Buckets are kept until the last period is read so a period
+        # collected again, after a failed commit, gets the same data.
+        if end >= cache_end:
+            del self._stats_cache[cache_key]
+        return buckets.get(start, [])
+
+    def clear_prefetched(self, project_id=None):
+        for cache_key in list(self._stats_cache):
+            if cache_key[1] == project_id:
+                del self._stats_cache[cache_key]
+
+    def _gen_time_filter(self, start, end=None):
+        req_filter = self.gen_filter(op='ge', timestamp=ck_utils.ts2iso(start))
+        if end:
+            end_iso = ck_utils.ts2iso(end)
+            req_filter.extend(self.gen_filter(op='le', timestamp=end_iso))
+        return req_filter
+
+    def _get_projects_stats(self, meter, start, end):
+        """Statistics of every project for a meter, grouped by project.
+
+        Concurrent callers asking for the same meter and period wait for a
+        single request.
+        """
+        cache_key = (meter, start, end)
+        while cache_key not in self._projects_stats:
+            pending = self._projects_stats_pending.get(cache_key)
+            if pending is not None:
+                pending.wait()
+                continue
+            pending = event.Event()
+            self._projects_stats_pending[cache_key] = pending
+            try:
+                stats = self._request(
+                    self._conn.statistics.list,
+                    meter_name=meter,
+                    period=0,
+                    q=self._gen_time_filter(start, end),
+                    groupby=['resource_id', 'project_id'])
+                projects_stats = {}
+                for stat in stats:
+                    project_stats = projects_stats.setdefault(
+                        stat.groupby['project_id'],
+                        [])
+                    project_stats.append(stat)
+                self._projects_stats[cache_key] = projects_stats
+                while len(self._projects_stats) > CROSS_PROJECT_CACHE_SIZE:
+                    self._projects_stats.popitem(last=False)
+            finally:
+                del self._projects_stats_pending[cache_key]
+                pending.send()
+        return self._projects_stats[cache_key]
+
     def resources_stats(self,
                         meter,
                         start,
                         end=None,
                         project_id=None,
-                        q_filter=None):
+                        q_filter=None,
+                        period=0):
         """Resources statistics during the timespan."""
-        start_iso = ck_utils.ts2iso(start)
-        req_filter = self.gen_filter(op='ge', timestamp=start_iso)
+        if not period and not q_filter:
+            stats = self._get_prefetched_stats(meter, start, end, project_id)
+            if stats is not None:
+                return stats
+            collector_conf = CONF[CEILOMETER_COLLECTOR_OPTS]
+            if project_id and collector_conf.collect_all_projects:
+                projects_stats = self._get_projects_stats(meter, start, end)
+                return projects_stats.get(project_id, [])
+        req_filter = self._gen_time_filter(start, end)
         if project_id:
             req_filter.extend(self.gen_filter(project=project_id))
-        if end:
-            end_iso = ck_utils.ts2iso(end)
-            req_filter.extend(self.gen_filter(op='le', timestamp=end_iso))
         if isinstance(q_filter, list):
             req_filter.extend(q_filter)
         elif q_filter:
             req_filter.append(q_filter)
-        resources_stats = self._conn.statistics.list(meter_name=meter,
-                                                     period=0, q=req_filter,
-                                                     groupby=['resource_id'])
+        resources_stats = self._request(self._conn.statistics.list,
+                                        meter_name=meter,
+                                        period=period,
+                                        q=req_filter,
+                                        groupby=['resource_id'])
         return resources_stats
 
     def active_resources(self,
@@ -160,161 +499,152 @@ class CeilometerCollector(collector.BaseCollector):
         return [resource.groupby['resource_id']
                 for resource in resources_stats]
 
-    def get_compute(self, start, end=None, project_id=None, q_filter=None):
-        active_instance_ids = self.active_resources('instance', start, end,
-                                                    project_id, q_filter)
-        compute_data = []
-        for instance_id in active_instance_ids:
-            if not self._cacher.has_resource_detail('compute', instance_id):
-                raw_resource = self._conn.resources.get(instance_id)
-                instance = self.t_ceilometer.strip_resource_data('compute',
-                                                                 raw_resource)
-                self._cacher.add_resource_detail('compute',
-                                                 instance_id,
-                                                 instance)
-            instance = self._cacher.get_resource_detail('compute',
-                                                        instance_id)
-            compute_data.append(self.t_cloudkitty.format_item(instance,
-                                                              'instance',
-                                                              1))
-        if not compute_data:
-            raise collector.NoDataCollected(self.collector_name, 'compute')
-        return self.t_cloudkitty.format_service('compute', compute_data)
-
-    def get_image(self, start, end=None, project_id=None, q_filter=None):
-        active_image_stats = self.resources_stats('image.size',
-                                                  start,
-                                                  end,
-                                                  project_id,
-                                                  q_filter)
-        image_data = []
-        for image_stats in active_image_stats:
-            image_id = image_stats.groupby['resource_id']
-            if not self._cacher.has_resource_detail('image', image_id):
-                raw_resource = self._conn.resources.get(image_id)
-                image = self.t_ceilometer.strip_resource_data('image',
-                                                              raw_resource)
-                self._cacher.add_resource_detail('image',
-                                                 image_id,
-                                                 image)
-            image = self._cacher.get_resource_detail('image',
-                                                     image_id)
-            image_data.append(self.t_cloudkitty.format_item(image,
-                                                            'image',
-                                                            image_stats.max))
-        if not image_data:
-            raise collector.NoDataCollected(self.collector_name, 'image')
-        return self.t_cloudkitty.format_service('image', image_data)
-
-    def get_volume(self, start, end=None, project_id=None, q_filter=None):
-        active_volume_stats = self.resources_stats('volume.size',
-                                                   start,
-                                                   end,
-                                                   project_id,
-                                                   q_filter)
-        volume_data = []
-        for volume_stats in active_volume_stats:
-            volume_id = volume_stats.groupby['resource_id']
-            if not self._cacher.has_resource_detail('volume',
-                                                    volume_id):
-                raw_resource = self._conn.resources.get(volume_id)
-                volume = self.t_ceilometer.strip_resource_data('volume',
-                                                               raw_resource)
-                self._cacher.add_resource_detail('volume',
-                                                 volume_id,
-                                                 volume)
-            volume = self._cacher.get_resource_detail('volume',
-                                                      volume_id)
-            volume_data.append(self.t_cloudkitty.format_item(volume,
-                                                             'GB',
-                                                             volume_stats.max))
-        if not volume_data:
-            raise collector.NoDataCollected(self.collector_name, 'volume')
-        return self.t_cloudkitty.format_service('volume', volume_data)
-
-    def _get_network_bw(self,
-                        direction,
-                        start,
-                        end=None,
-                        project_id=None,
-                        q_filter=None):
-        if direction == 'in':
-            resource_type = 'network.incoming.bytes'
+    def _list_resources(self, start, end, project_id):
+        """Resources of a project which had samples during the timespan.
+
+        The last listings are kept so every service collected for the same
+        period and project shares a single request, even when several
+        tenants are processed at the same time.
+        """
+        listing_key = (start, end, project_id)
+        listing = self._resources_listings.pop(listing_key, None)
+        if listing is None:
+            req_filter = self._gen_time_filter(start, end)
+            req_filter.extend(self.gen_filter(project=project_id))
+            resources = self._request(self._conn.resources.list,
+                                      q=req_filter)
+            listing = dict(
+                (resource.resource_id, resource) for resource in resources)
+        # Reinsert the listing to mark it as the most recently used
+        self._resources_listings[listing_key] = listing
+        while len(self._resources_listings) > RESOURCES_LISTING_CACHE_SIZE:
+            self._resources_listings.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def _details_cache_key(resource_type, metadata=None):
+        """Key of the cached details stripped with the given rules."""
+        if not metadata:
+            return resource_type
+        return '{}:{}'.format(resource_type,
+                              json.dumps(metadata, sort_keys=True))
+
+    def _load_resources_details(self,
+                                resource_type,
+                                resource_ids,
+                                start,
+                                end=None,
+                                project_id=None,
+                                metadata=None):
+        """Return the details of resources, fetching the unknown ones.
+
+        Details are taken from a single listing of the project's resources,
+        resources missing from the listing are requested one by one. They
+        are returned directly, as the cache can evict them before they are
+        used.
+
+        :return: Dict of details keyed by resource id.
+        """
+        cache_key = self._details_cache_key(resource_type, metadata)
+        details = {}
+        missing_ids = []
+        for resource_id in resource_ids:
+            resource = self._cacher.find_resource_detail(cache_key,
+                                                         resource_id)
+            if resource is None:
+                missing_ids.append(resource_id)
+            else:
+                details[resource_id] = resource
+        if not missing_ids:
+            return details
+        listing = {}
+        if project_id:
+            listing = self._list_resources(start, end, project_id)
+        unlisted_ids = [resource_id
+                        for resource_id in missing_ids
+                        if resource_id not in listing]
+        if listing and unlisted_ids:
+            # The resources API has no pagination, the listing is capped
+            # by ceilometer's [api]/default_api_return_limit.
+            LOG.warn('%(missing)d resources of project %(project)s were '
+                     'missing from a listing of %(listed)d resources, it '
+                     'may have been truncated by the API. They are fetched '
+                     'one by one.', {'missing': len(unlisted_ids),
+                                     'project': project_id,
+                                     'listed': len(listing)})
+        raw_resources = dict(
+            (resource_id, listing[resource_id])
+            for resource_id in missing_ids
+            if resource_id in listing)
+        # Fetch the resources which were not listed concurrently
+        fetched = self._requests_pool.imap(
+            lambda resource_id: self._request(self._conn.resources.get,
+                                              resource_id),
+            unlisted_ids)
+        raw_resources.update(zip(unlisted_ids, fetched))
+        for resource_id in missing_ids:
+            if metadata:
+                resource = self.t_ceilometer.strip_metadata(
+                    raw_resources[resource_id],
+                    metadata)
+            else:
+                resource = self.t_ceilometer.strip_resource_data(
+                    resource_type,
+                    raw_resources[resource_id])
+            details[resource_id] = self._cacher.add_resource_detail(
+                cache_key,
+                resource_id,
+                resource)
+        return details
+
+    def _stats_columns(self, stats, aggregate=None, factor=1):
+        """Split statistics in resource ids and quantities columns.
+
+        :param stats: Statistics grouped by resource_id.
+        :param aggregate: Statistic used as quantity, every resource counts
+                          as one if not set.
+        :param factor: Conversion factor applied to every quantity.
+        :return: (resource_ids, quantities) tuple of lists.
+        """
+        resource_ids = [stat.groupby['resource_id'] for stat in stats]
+        if aggregate is None:
+            qtys = [factor] * len(resource_ids)
+        elif factor == 1:
+            qtys = [getattr(stat, aggregate) for stat in stats]
         else:
-            direction = 'out'
-            resource_type = 'network.outgoing.bytes'
-        active_tap_stats = self.resources_stats(resource_type,
-                                                start,
-                                                end,
-                                                project_id,
-                                                q_filter)
-        bw_data = []
-        for tap_stat in active_tap_stats:
-            tap_id = tap_stat.groupby['resource_id']
-            if not self._cacher.has_resource_detail('network.tap',
-                                                    tap_id):
-                raw_resource = self._conn.resources.get(tap_id)
-                tap = self.t_ceilometer.strip_resource_data(
-                    'network.tap',
-                    raw_resource)
-                self._cacher.add_resource_detail('network.tap',
-                                                 tap_id,
-                                                 tap)
-            tap = self._cacher.get_resource_detail('network.tap',
-                                                   tap_id)
-            tap_bw_mb = tap_stat.max / 1048576.0
-            bw_data.append(self.t_cloudkitty.format_item(tap,
-                                                         'MB',
-                                                         tap_bw_mb))
-        ck_res_name = 'network.bw.{}'.format(direction)
-        if not bw_data:
-            raise collector.NoDataCollected(self.collector_name,
-                                            ck_res_name)
-        return self.t_cloudkitty.format_service(ck_res_name,
-                                                bw_data)
-
-    def get_network_bw_out(self,
-                           start,
-                           end=None,
-                           project_id=None,
-                           q_filter=None):
-        return self._get_network_bw('out', start, end, project_id, q_filter)
-
-    def get_network_bw_in(self,
-                          start,
-                          end=None,
-                          project_id=None,
-                          q_filter=None):
-        return self._get_network_bw('in', start, end, project_id, q_filter)
-
-    def get_network_floating(self,
-                             start,
-                             end=None,
-                             project_id=None,
-                             q_filter=None):
-        active_floating_ids = self.active_resources('ip.floating',
-                                                    start,
-                                                    end,
-                                                    project_id,
-                                                    q_filter)
-        floating_data = []
-        for floating_id in active_floating_ids:
-            if not self._cacher.has_resource_detail('network.floating',
-                                                    floating_id):
-                raw_resource = self._conn.resources.get(floating_id)
-                floating = self.t_ceilometer.strip_resource_data(
-                    'network.floating',
-                    raw_resource)
-                self._cacher.add_resource_detail('network.floating',
-                                                 floating_id,
-                                                 floating)
-            floating = self._cacher.get_resource_detail('network.floating',
-                                                        floating_id)
-            floating_data.append(self.t_cloudkitty.format_item(floating,
-                                                               'ip',
-                                                               1))
-        if not floating_data:
-            raise collector.NoDataCollected(self.collector_name,
-                                            'network.floating')
-        return self.t_cloudkitty.format_service('network.floating',
-                                                floating_data)
+            qtys = [getattr(stat, aggregate) * factor for stat in stats]
+        return resource_ids, qtys
+
+    def has_resource(self, resource):
+        if resource in self.metrics:
+            return True
+        return super(CeilometerCollector, self).has_resource(resource)
+
+    def retrieve(self, resource, start, end=None, project_id=None,
+                 q_filter=None):
+        if resource not in self.metrics:
+            return super(CeilometerCollector, self).retrieve(resource,
+                                                             start,
+                                                             end,
+                                                             project_id,
+                                                             q_filter)
+        metric = self.metrics[resource]
+        stats = self.resources_stats(metric['meter'],
+                                     start,
+                                     end,
+                                     project_id,
+                                     q_filter)
+        resource_ids, qtys = self._stats_columns(stats,
+                                                 metric['aggregate'],
+                                                 metric['factor'])
+        details = self._load_resources_details(metric['resource_type'],
+                                               resource_ids,
+                                               start,
+                                               end,
+                                               project_id,
+                                               metric['metadata'])
+        descs = [details[resource_id] for resource_id in resource_ids]
+        items = self.t_cloudkitty.format_items(descs, metric['unit'], qtys)
+        if not items:
+            raise collector.NoDataCollected(self.collector_name, resource)
+        return self.t_cloudkitty.format_service(resource, items)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""
+Columnar sample file format
+
+Samples are stored in chunks, one per (begin, type). Every chunk is made of
+three typed columns: description ids, unit ids and quantities. Descriptions
+and units are dictionary encoded, their values are stored once in the JSON
+footer of the file.
+
+Quantities are stored as doubles, the chunk records whether they were all
+integers so they are read back with their type. Chunks with other
+quantities (Decimal, mixed types or integers too large for a double) keep
+them in the footer instead of a column. The layout is the following::
+
+    MAGIC | columns... | JSON footer | footer length (uint64) | MAGIC
+"""
+import array
+import collections
+import csv
+import decimal
+import json
+import mmap
+import struct
+import sys
+
+import six
+
+MAGIC = b'CKCOL1'
+FOOTER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 8
+# Typecodes of the id and quantity columns
+ID_TYPE = 'I'
+QTY_TYPE = 'd'
+# Types of the quantities of a chunk
+QTY_FLOAT = 'float'
+QTY_INT = 'int'
+QTY_JSON = 'json'
+# Integers above this can't be stored in a double without loss
+MAX_EXACT_INT = 2 ** 53
+DECIMAL_MARKER = '__decimal__'
+
+
+class InvalidColumnarFile(Exception):
+    """Raised when a file is not a valid columnar file."""
+
+    def __init__(self, path, reason):
+        super(InvalidColumnarFile, self).__init__(
+            "Invalid columnar file %s: %s" % (path, reason))
+        self.path = path
+        self.reason = reason
+
+
+def chunk_key(begin, res_type):
+    return '{}:{}'.format(begin, res_type)
+
+
+def csv_row_to_item(row):
+    """Convert a row of the fake collector CSV format to an item.
+
+    :param row: Dict of the CSV fields.
+    """
+    return {'desc': json.loads(row['desc']),
+            'vol': json.loads(row['vol'])}
+
+
+def _get_qty_type(qtys):
+    if all(isinstance(qty, float) for qty in qtys):
+        return QTY_FLOAT
+    if all(type(qty) in six.integer_types and abs(qty) <= MAX_EXACT_INT
+           for qty in qtys):
+        return QTY_INT
+    return QTY_JSON
+
+
+def _encode_qty(value):
+    if isinstance(value, decimal.Decimal):
+        return {DECIMAL_MARKER: str(value)}
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def _decode_qty(value):
+    if isinstance(value, dict):
+        return decimal.Decimal(value[DECIMAL_MARKER])
+    return value
+
+
+class ColumnarWriter(object):
+    """Write samples to a columnar file.
+
+    :param path: Path of the file to write.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._descs = []
+        self._desc_ids = {}
+        self._units = []
+        self._unit_ids = {}
+        self._chunks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _encode(value, values, ids):
+        key = json.dumps(value, sort_keys=True)
+        if key not in ids:
+            ids[key] = len(values)
+            values.append(value)
+        return ids[key]
+
+    def _write_column(self, typecode, values):
+        padding = -self._offset % ALIGNMENT
+        self._file.write(b'\0' * padding)
+        offset = self._offset + padding
+        column = array.array(typecode, values)
+        data = column.tostring() if six.PY2 else column.tobytes()
+        self._file.write(data)
+        self._offset = offset + len(data)
+        return offset
+
+    def add_chunk(self, begin, end, res_type, items):
+        """Add the items of a service for a period.
+
+        :param begin: Begin timestamp of the period.
+        :param end: End timestamp of the period.
+        :param res_type: Service of the items.
+        :param items: List of items in the CloudKitty format.
+        """
+        key = chunk_key(begin, res_type)
+        if key in self._chunks:
+            raise ValueError('Chunk %s already written.' % key)
+        desc_ids = [self._encode(item['desc'], self._descs, self._desc_ids)
+                    for item in items]
+        unit_ids = [self._encode(item['vol']['unit'],
+                                 self._units,
+                                 self._unit_ids)
+                    for item in items]
+        qtys = [item['vol']['qty'] for item in items]
+        qty_type = _get_qty_type(qtys)
+        chunk = {
+            'end': end,
+            'count': len(items),
+            'desc': self._write_column(ID_TYPE, desc_ids),
+            'unit': self._write_column(ID_TYPE, unit_ids),
+            'qty_type': qty_type}
+        if qty_type == QTY_JSON:
+            chunk['qtys'] = qtys
+        else:
+            chunk['qty'] = self._write_column(QTY_TYPE, qtys)
+        self._chunks[key] = chunk
+
+    def close(self):
+        if self._file.closed:
+            return
+        footer = {'byteorder': sys.byteorder,
+                  'itemsizes': {
+                      ID_TYPE: array.array(ID_TYPE).itemsize,
+                      QTY_TYPE: array.array(QTY_TYPE).itemsize},
+                  'descs': self._descs,
+                  'units': self._units,
+                  'chunks': self._chunks}
+        data = json.dumps(footer, default=_encode_qty).encode('utf-8')
+        self._file.write(data)
+        self._file.write(FOOTER_LENGTH.pack(len(data)))
+        self._file.write(MAGIC)
+        self._file.close()
+
+
+class ColumnarFile(object):
+    """Read a columnar file.
+
+    The file is memory-mapped, columns are returned as views on the mapping
+    without copy (on Python 3). The mapping can't be unmapped while views
+    are in use, they should be released with release_columns once done.
+
+    :param path: Path of the file to read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as input_file:
+            try:
+                self._mmap = mmap.mmap(input_file.fileno(),
+                                       0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                raise InvalidColumnarFile(path, 'empty file')
+        self._load_footer()
+
+    def _load_footer(self):
+        size = len(self._mmap)
+        tail_size = FOOTER_LENGTH.size + len(MAGIC)
+        if size < len(MAGIC) + tail_size:
+            raise InvalidColumnarFile(self.path, 'truncated file')
+        magics = (self._mmap[:len(MAGIC)], self._mmap[size - len(MAGIC):])
+        if magics != (MAGIC, MAGIC):
+            raise InvalidColumnarFile(self.path, 'bad magic')
+        footer_end = size - tail_size
+        (footer_size, ) = FOOTER_LENGTH.unpack(
+            self._mmap[footer_end:footer_end + FOOTER_LENGTH.size])
+        footer = json.loads(
+            self._mmap[footer_end - footer_size:footer_end].decode('utf-8'))
+        self.res_types = set(key.split(':', 1)[1]
+                             for key in footer['chunks'])
+        if footer['byteorder'] != sys.byteorder:
+            raise InvalidColumnarFile(self.path, 'byte order mismatch')
+        for typecode, itemsize in footer['itemsizes'].items():
+            if array.array(typecode).itemsize != itemsize:
+                raise InvalidColumnarFile(self.path, 'item size mismatch')
+        self.descs = footer['descs']
+        self.units = footer['units']
+        self.chunks = footer['chunks']
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Columns are still in use, the mapping is unmapped once the
+            # last of them is garbage collected.
+            pass
+
+    def _column(self, offset, typecode, count):
+        size = array.array(typecode).itemsize * count
+        if six.PY2:
+            return array.array(typecode, self._mmap[offset:offset + size])
+        # Only the returned view keeps the mapping exported
+        with memoryview(self._mmap) as view:
+            with view[offset:offset + size] as column:
+                return column.cast(typecode)
+
+    @staticmethod
+    def release_columns(columns):
+        """Release the columns returned by get_columns.
+
+        :param columns: Columns of a chunk, they can't be used afterwards.
+        """
+        if six.PY2:
+            return
+        for column in columns:
+            if isinstance(column, memoryview):
+                column.release()
+
+    def get_columns(self, begin, res_type):
+        """Return the columns of a chunk.
+
+        :param begin: Begin timestamp of the period.
+        :param res_type: Service of the items.
+        :returns: (desc ids, unit ids, quantities) or None if the chunk
+                  doesn't exist. Quantities are a list when the chunk keeps
+                  them in the footer, see get_qty_type.
+        """
+        chunk = self.chunks.get(chunk_key(begin, res_type))
+        if chunk is None:
+            return None
+        count = chunk['count']
+        if chunk.get('qty_type') == QTY_JSON:
+            qtys = [_decode_qty(qty) for qty in chunk['qtys']]
+        else:
+            qtys = self._column(chunk['qty'], QTY_TYPE, count)
+        return (self._column(chunk['desc'], ID_TYPE, count),
+                self._column(chunk['unit'], ID_TYPE, count),
+                qtys)
+
+    def get_qty_type(self, begin, res_type):
+        """Return the type of the quantities of a chunk.
+
+        QTY_INT quantities are stored as doubles and must be converted back
+        to integers.
+        """
+        chunk = self.chunks[chunk_key(begin, res_type)]
+        return chunk.get('qty_type', QTY_FLOAT)
+
+    def get_items(self, begin, res_type):
+        """Return the items of a chunk in the CloudKitty format.
+
+        Descriptions are shared between the items of the file, they must not
+        be modified.
+        """
+        columns = self.get_columns(begin, res_type)
+        if columns is None:
+            return []
+        descs, units = self.descs, self.units
+        desc_ids, unit_ids, qtys = columns
+        try:
+            if self.get_qty_type(begin, res_type) == QTY_INT:
+                qtys = [int(qty) for qty in qtys]
+            return [{'desc': descs[desc_id],
+                     'vol': {'unit': units[unit_id], 'qty': qty}}
+                    for desc_id, unit_id, qty in zip(desc_ids,
+                                                     unit_ids,
+                                                     qtys)]
+        finally:
+            self.release_columns(columns)
+
+
+def convert_csv(csv_path, path):
+    """Convert a CSV file of the fake collector to a columnar file.
+
+    :param csv_path: Path of the CSV file.
+    :param path: Path of the columnar file to write.
+    """
+    chunks = collections.OrderedDict()
+    with open(csv_path, 'r') as csv_file:
+        for row in csv.DictReader(csv_file):
+            key = (int(row['begin']), int(row['end']), row['type'])
+            chunks.setdefault(key, []).append(csv_row_to_item(row))
+    with ColumnarWriter(path) as writer:
+        for (begin, end, res_type), items in chunks.items():
+            writer.add_chunk(begin, end, res_type, items)
@@ -17,20 +17,42 @@
 #
 import csv
 import json
+import mmap
+import os
 
 from oslo_config import cfg
+from oslo_log import log as logging
+import six
 
 from cloudkitty import collector
+from cloudkitty.collector import columnar
+
+LOG = logging.getLogger(__name__)
 
 fake_collector_opts = [
     cfg.StrOpt('file',
                default='/var/lib/cloudkitty/input.csv',
-               help='Collector input file.')]
+               help='Collector input file.'),
+    cfg.StrOpt('columnar_file',
+               default='/var/lib/cloudkitty/input.ckc',
+               help='Columnar collector input file.')]
 
 cfg.CONF.register_opts(fake_collector_opts, 'fake_collector')
 
 
+def _parse_lines(raw_lines):
+    if six.PY3:
+        raw_lines = raw_lines.decode('utf-8')
+    return csv.reader(raw_lines.splitlines())
+
+
 class CSVCollector(collector.BaseCollector):
+    """Collector reading samples from a CSV file.
+
+    Rows are indexed by begin timestamp and type on first use, each call
+    only parses the rows it returns. The index is saved next to the input
+    file and reused as long as the input file is not modified.
+    """
     collector_name = 'csvcollector'
     dependencies = ('CloudKittyFormatTransformer', )
 
@@ -39,28 +61,106 @@ class CSVCollector(collector.BaseCollector):
 
         self.t_cloudkitty = self.transformers['CloudKittyFormatTransformer']
         self._file = None
-        self._csv = None
+        self._mmap = None
+        self._file_stat = None
+        self._fieldnames = []
+        self._index = {}
+
+    @staticmethod
+    def _index_key(begin, res_type):
+        return '{}:{}'.format(begin, res_type)
+
+    @staticmethod
+    def _get_file_stat(filename):
+        file_stat = os.stat(filename)
+        return [file_stat.st_size, file_stat.st_mtime]
+
+    def _close_csv(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_csv()
 
     def _open_csv(self):
         filename = cfg.CONF.fake_collector.file
-        csvfile = open(filename, 'rb')
-        reader = csv.DictReader(csvfile)
-        self._file = csvfile
-        self._csv = reader
+        file_stat = self._get_file_stat(filename)
+        if self._mmap is not None and file_stat == self._file_stat:
+            return
+        self._close_csv()
+        self._file = open(filename, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(),
+                               0,
+                               access=mmap.ACCESS_READ)
+        self._file_stat = file_stat
+        if not self._load_index(filename + '.idx'):
+            self._build_index()
+            self._save_index(filename + '.idx')
+
+    def _build_index(self):
+        """Map (begin, type) to the byte ranges of the matching rows."""
+        self._mmap.seek(0)
+        self._fieldnames = next(_parse_lines(self._mmap.readline()))
+        begin_idx = self._fieldnames.index('begin')
+        type_idx = self._fieldnames.index('type')
+        self._index = {}
+        offset = self._mmap.tell()
+        raw_line = self._mmap.readline()
+        while raw_line:
+            next_offset = self._mmap.tell()
+            for row in _parse_lines(raw_line):
+                key = self._index_key(int(row[begin_idx]), row[type_idx])
+                spans = self._index.setdefault(key, [])
+                # Merge contiguous rows in a single span
+                if spans and spans[-1][1] == offset:
+                    spans[-1][1] = next_offset
+                else:
+                    spans.append([offset, next_offset])
+            offset = next_offset
+            raw_line = self._mmap.readline()
+
+    def _load_index(self, path):
+        try:
+            with open(path) as index_file:
+                index_data = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return False
+        if index_data.get('file_stat') != self._file_stat:
+            return False
+        self._fieldnames = index_data['fieldnames']
+        self._index = index_data['index']
+        return True
+
+    def _save_index(self, path):
+        index_data = {'file_stat': self._file_stat,
+                      'fieldnames': self._fieldnames,
+                      'index': self._index}
+        try:
+            with open(path, 'w') as index_file:
+                json.dump(index_data, index_file)
+        except (IOError, OSError) as e:
+            LOG.warn('Unable to save the CSV index to %s: %s', path, e)
 
     def filter_rows(self,
                     start,
                     end=None,
                     project_id=None,
                     res_type=None):
+        if res_type:
+            keys = [self._index_key(start, res_type)]
+        else:
+            prefix = self._index_key(start, '')
+            keys = sorted(key for key in self._index
+                          if key.startswith(prefix))
         rows = []
-        for row in self._csv:
-            if int(row['begin']) == start:
-                if res_type:
-                    if row['type'] == res_type:
-                        rows.append(row)
-                else:
-                    rows.append(row)
+        for key in keys:
+            for span_start, span_end in self._index.get(key, []):
+                for row in _parse_lines(self._mmap[span_start:span_end]):
+                    rows.append(dict(zip(self._fieldnames, row)))
         return rows
 
     def _get_data(self,
@@ -71,11 +171,7 @@ class CSVCollector(collector.BaseCollector):
                   q_filter=None):
         self._open_csv()
         rows = self.filter_rows(start, end, project_id, res_type=res_type)
-        data = []
-        for row in rows:
-            data.append({
-                'desc': json.loads(row['desc']),
-                'vol': json.loads(row['vol'])})
+        data = [columnar.csv_row_to_item(row) for row in rows]
         if not data:
             raise collector.NoDataCollected(self.collector_name, res_type)
         return self.t_cloudkitty.format_service(res_type, data)
@@ -145,3 +241,47 @@ class CSVCollector(collector.BaseCollector):
                               end,
                               project_id,
                               q_filter)
+
+
+class ColumnarCollector(collector.BaseCollector):
+    """Collector reading samples from a columnar file.
+
+    The input is produced from a CSV file by columnar.convert_csv, the items
+    of a period are built directly from the typed columns of the file. Every
+    service stored in the file can be retrieved.
+    """
+    collector_name = 'columnarcollector'
+    dependencies = ('CloudKittyFormatTransformer', )
+
+    def __init__(self, transformers, **kwargs):
+        super(ColumnarCollector, self).__init__(transformers, **kwargs)
+
+        self.t_cloudkitty = self.transformers['CloudKittyFormatTransformer']
+        self._columnar = None
+
+    def _get_file(self):
+        if self._columnar is None:
+            self._columnar = columnar.ColumnarFile(
+                cfg.CONF.fake_collector.columnar_file)
+        return self._columnar
+
+    def close(self):
+        if self._columnar is not None:
+            self._columnar.close()
+            self._columnar = None
+
+    def has_resource(self, resource):
+        try:
+            return resource in self._get_file().res_types
+        except (IOError, OSError, columnar.InvalidColumnarFile) as e:
+            LOG.warn('Unable to read the columnar file: %s', e)
+            return False
+
+    def retrieve(self, resource, start, end=None, project_id=None,
+                 q_filter=None):
+        if not self.has_resource(resource):
+            return None
+        data = self._get_file().get_items(start, resource)
+        if not data:
+            raise collector.NoDataCollected(self.collector_name, resource)
+        return self.t_cloudkitty.format_service(resource, data)
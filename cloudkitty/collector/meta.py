@@ -15,38 +15,48 @@
 #
 # @author: Stéphane Albert
 #
+from oslo_config import cfg
+from oslo_log import log as logging
 from stevedore import extension
 
 from cloudkitty import collector
 from cloudkitty.db import api as db_api
 
+LOG = logging.getLogger(__name__)
+
 COLLECTORS_NAMESPACE = 'cloudkitty.collector.backends'
 
 
 class MetaCollector(collector.BaseCollector):
+    """Dispatch every resource to the collector able to retrieve it.
+
+    Services can be explicitly mapped to a collector, other services are
+    retrieved by the first enabled collector supporting them. Routing is
+    resolved once per service and kept in a dispatch table until the next
+    call to refresh. Collectors are kept between refreshes as long as they
+    stay enabled.
+    """
     def __init__(self, transformers, **kwargs):
         super(MetaCollector, self).__init__(transformers, **kwargs)
 
         self._db = db_api.get_instance().get_service_to_collector_mapping()
 
         self._collectors = {}
-        self._load_collectors()
-
         self._mappings = {}
-        self._load_mappings()
+        self._dispatch = {}
+        self.refresh()
 
     def _load_mappings(self):
-        mappings = self._db.list_services()
-        for mapping in mappings:
-            db_mapping = self._db.get_mapping(mapping.service)
-            self._mappings[db_mapping.service] = db_mapping.collector
+        return dict((mapping.service, mapping.collector)
+                    for mapping in self._db.list_mappings())
 
     def _check_enabled(self, name):
         enable_state = db_api.get_instance().get_module_enable_state()
         return enable_state.get_state('collector_{}'.format(name))
 
     def _load_collectors(self):
-        self._collectors = {}
+        """Return the enabled collectors, reusing the loaded instances."""
+        loaded_collectors = {}
         collectors = extension.ExtensionManager(
             COLLECTORS_NAMESPACE,
         )
@@ -54,31 +64,89 @@ class MetaCollector(collector.BaseCollector):
         collectors_list.remove('meta')
 
         for name in collectors_list:
-            if self._check_enabled(name):
-                self._collectors[name] = collectors[name].plugin(
+            if not self._check_enabled(name):
+                continue
+            cur_collector = self._collectors.get(name)
+            if cur_collector is None:
+                cur_collector = collectors[name].plugin(
                     self.transformers,
                     period=self.period)
-
-    def map_retrieve(self, trans_resource, res_collector=None):
-        if res_collector:
-            if hasattr(res_collector, trans_resource):
-                return getattr(res_collector, trans_resource)
+            loaded_collectors[name] = cur_collector
+        return loaded_collectors
+
+    @staticmethod
+    def _close_collector(name, cur_collector):
+        try:
+            cur_collector.close()
+        except Exception:
+            LOG.exception('Error while closing collector %s.', name)
+
+    def refresh(self):
+        """Reload collectors and mappings and rebuild the dispatch table.
+
+        Collectors which were disabled are closed.
+        """
+        collectors = self._load_collectors()
+        mappings = self._load_mappings()
+        dispatch = {}
+        for resource in cfg.CONF.collect.services:
+            dispatch[resource] = self._resolve(resource,
+                                               collectors,
+                                               mappings)
+        # Swap the tables only once they are complete
+        dropped = [(name, cur_collector)
+                   for name, cur_collector in self._collectors.items()
+                   if name not in collectors]
+        self._collectors = collectors
+        self._mappings = mappings
+        self._dispatch = dispatch
+        for name, cur_collector in dropped:
+            self._close_collector(name, cur_collector)
+
+    def close(self):
+        for name, cur_collector in self._collectors.items():
+            self._close_collector(name, cur_collector)
+        self._collectors = {}
+        self._dispatch = {}
+
+    @staticmethod
+    def _resolve(resource, collectors, mappings):
+        res_collector = collectors.get(mappings.get(resource))
+        if res_collector and res_collector.has_resource(resource):
+            return res_collector
+        for cur_collector in collectors.values():
+            if cur_collector.has_resource(resource):
+                return cur_collector
+
+    def map_collector(self, resource):
+        """Return the collector in charge of a resource, None if none."""
+        try:
+            return self._dispatch[resource]
+        except KeyError:
+            cur_collector = self._resolve(resource,
+                                          self._collectors,
+                                          self._mappings)
+            self._dispatch[resource] = cur_collector
+            return cur_collector
+
+    def has_resource(self, resource):
+        return self.map_collector(resource) is not None
+
+    def prefetch(self, resource, start, end, project_id=None):
+        cur_collector = self.map_collector(resource)
+        if cur_collector is not None:
+            cur_collector.prefetch(resource, start, end, project_id)
+
+    def clear_prefetched(self, project_id=None):
         for cur_collector in self._collectors.values():
-            if hasattr(cur_collector, trans_resource):
-                return getattr(cur_collector, trans_resource)
+            cur_collector.clear_prefetched(project_id)
 
     def retrieve(self, resource, start, end=None, project_id=None,
                  q_filter=None):
-
-        # Resource to function translation
-        trans_resource = 'get_'
-        trans_resource += resource.replace('.', '_')
-
-        # Resource to collector mapping processing
-        res_collector = None
-        if resource in self._mappings and resource in self._collectors:
-            res_collector = self._collectors[resource]
-
-        func = self.map_retrieve(trans_resource, res_collector)
-        if func is not None:
-            return func(start, end, project_id, q_filter)
+        cur_collector = self.map_collector(resource)
+        if cur_collector is not None:
+            return cur_collector.retrieve(resource,
+                                          start,
+                                          end,
+                                          project_id,
+                                          q_filter)
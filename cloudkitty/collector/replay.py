@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""
+Collection recording and replay
+
+RecordingCollector wraps any collector and saves every retrieve call with
+its result, ReplayCollector serves a recording without querying any backend.
+"""
+import copy
+import decimal
+import gzip
+import json
+
+import eventlet
+from oslo_config import cfg
+
+from cloudkitty import collector
+
+replay_collector_opts = [
+    cfg.StrOpt('file',
+               default='/var/lib/cloudkitty/recording.json.gz',
+               help='Recording replayed by the replay collector.'),
+    cfg.FloatOpt('latency',
+                 default=0.0,
+                 help='Seconds added to every replayed retrieve call.'),
+    cfg.StrOpt('record_file',
+               help='Record the data retrieved by the collector in this '
+                    'file, nothing is recorded if unset.'),
+]
+
+cfg.CONF.register_opts(replay_collector_opts, 'replay_collector')
+
+
+# Key of the objects standing for a Decimal in a recording
+DECIMAL_MARKER = '__decimal__'
+
+
+def _encode_decimal(value):
+    # Decimals are kept apart from floats so they are replayed unchanged
+    if isinstance(value, decimal.Decimal):
+        return {DECIMAL_MARKER: str(value)}
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def _decode_decimal(obj):
+    if len(obj) == 1 and DECIMAL_MARKER in obj:
+        return decimal.Decimal(obj[DECIMAL_MARKER])
+    return obj
+
+
+class RecordingCollector(object):
+    """Collector wrapper recording every retrieve call.
+
+    Every call is appended to a gzip compressed file as a JSON document, a
+    separate gzip member is written for each call so the recording stays
+    readable if the processor is stopped.
+
+    :param wrapped: Collector to record.
+    :param path: Path of the recording.
+    """
+
+    def __init__(self, wrapped, path):
+        self._wrapped = wrapped
+        self._path = path
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def _record(self, resource, start, end, project_id, data):
+        record = {'resource': resource,
+                  'start': start,
+                  'end': end,
+                  'project_id': project_id,
+                  'data': data}
+        line = json.dumps(record, default=_encode_decimal) + '\n'
+        with gzip.open(self._path, 'ab') as recording:
+            recording.write(line.encode('utf-8'))
+
+    def prefetch(self, resource, start, end, project_id=None):
+        self._wrapped.prefetch(resource, start, end, project_id)
+
+    def clear_prefetched(self, project_id=None):
+        self._wrapped.clear_prefetched(project_id)
+
+    def retrieve(self, resource, start, end=None, project_id=None,
+                 q_filter=None):
+        try:
+            data = self._wrapped.retrieve(resource,
+                                          start,
+                                          end,
+                                          project_id,
+                                          q_filter)
+        except collector.NoDataCollected:
+            self._record(resource, start, end, project_id, None)
+            raise
+        self._record(resource, start, end, project_id, data)
+        return data
+
+
+class ReplayCollector(collector.BaseCollector):
+    """Serve the data of a recording made by RecordingCollector."""
+
+    collector_name = 'replay'
+    dependencies = tuple()
+
+    def __init__(self, transformers, **kwargs):
+        super(ReplayCollector, self).__init__(transformers, **kwargs)
+
+        self._latency = cfg.CONF.replay_collector.latency
+        self._resources = set()
+        self._records = {}
+        self._load(cfg.CONF.replay_collector.file)
+
+    def _load(self, path):
+        with gzip.open(path, 'rb') as recording:
+            for line in recording:
+                record = json.loads(line.decode('utf-8'),
+                                    object_hook=_decode_decimal)
+                key = (record['resource'],
+                       record['start'],
+                       record['end'],
+                       record['project_id'])
+                self._records[key] = record['data']
+                self._resources.add(record['resource'])
+
+    def has_resource(self, resource):
+        return resource in self._resources
+
+    def retrieve(self, resource, start, end=None, project_id=None,
+                 q_filter=None):
+        if resource not in self._resources:
+            raise collector.NoDataCollected(self.collector_name, resource)
+        if self._latency:
+            eventlet.sleep(self._latency)
+        data = self._records.get((resource, start, end, project_id))
+        if data is None:
+            raise collector.NoDataCollected(self.collector_name, resource)
+        # Rating processors and the storage modify the data in place
+        return copy.deepcopy(data)
@@ -19,9 +19,11 @@ import itertools
 import cloudkitty.api.app
 import cloudkitty.collector
 import cloudkitty.collector.ceilometer
+import cloudkitty.collector.replay
 import cloudkitty.config
 import cloudkitty.service
 import cloudkitty.storage
+import cloudkitty.storage.sqlalchemy
 import cloudkitty.tenant_fetcher
 import cloudkitty.tenant_fetcher.keystone
 
@@ -30,16 +32,24 @@ __all__ = ['list_opts']
 _opts = [
     ('api', list(itertools.chain(
         cloudkitty.api.app.api_opts,))),
+    ('ceilometer_collector', list(itertools.chain(
+        cloudkitty.collector.ceilometer.ceilometer_collector_opts))),
     ('collect', list(itertools.chain(
         cloudkitty.collector.collect_opts))),
     ('keystone_fetcher', list(itertools.chain(
         cloudkitty.tenant_fetcher.keystone.keystone_fetcher_opts))),
+    ('orchestrator', list(itertools.chain(
+        cloudkitty.config.orchestrator_opts))),
     ('output', list(itertools.chain(
         cloudkitty.config.output_opts))),
+    ('replay_collector', list(itertools.chain(
+        cloudkitty.collector.replay.replay_collector_opts))),
     ('state', list(itertools.chain(
         cloudkitty.config.state_opts))),
     ('storage', list(itertools.chain(
         cloudkitty.storage.storage_opts))),
+    ('storage_sqlalchemy', list(itertools.chain(
+        cloudkitty.storage.sqlalchemy.sqlalchemy_storage_opts))),
     ('tenant_fetcher', list(itertools.chain(
         cloudkitty.tenant_fetcher.fetchers_opts))),
     (None, list(itertools.chain(
@@ -39,9 +39,26 @@ output_opts = [
                 default=['osrf'],
                 help='Output pipeline'), ]
 
+orchestrator_opts = [
+    cfg.IntOpt('max_workers',
+               default=1,
+               help='Maximum number of tenants processed concurrently.'),
+    cfg.IntOpt('max_service_workers',
+               default=1,
+               help='Maximum number of services collected concurrently for '
+                    'a tenant.'),
+    cfg.IntOpt('heartbeat_interval',
+               default=30,
+               help='Interval in seconds between two processor heartbeats.'),
+    cfg.IntOpt('member_timeout',
+               default=90,
+               help='Number of seconds without heartbeat after which a '
+                    'processor is considered dead and its tenants are '
+                    'rebalanced.'), ]
 
 cfg.CONF.register_opts(state_opts, 'state')
 cfg.CONF.register_opts(output_opts, 'output')
+cfg.CONF.register_opts(orchestrator_opts, 'orchestrator')
 
 # oslo.db defaults
 db_options.set_defaults(
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""
+Processors coordination
+
+Tenants are spread between every live processor using a consistent hash ring,
+membership is tracked in the database through heartbeats. A tenant is leased
+in the database while it is processed so two processors never work on it at
+the same time when the ring changes.
+"""
+import bisect
+import hashlib
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from cloudkitty import config  # noqa
+from cloudkitty.db import api as db_api
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.import_opt('heartbeat_interval', 'cloudkitty.config', 'orchestrator')
+CONF.import_opt('member_timeout', 'cloudkitty.config', 'orchestrator')
+
+
+class HashRing(object):
+    """Consistent hash ring mapping keys to members.
+
+    :param members: Name of the members of the ring.
+    :param replicas: Number of virtual nodes per member.
+    """
+
+    def __init__(self, members, replicas=100):
+        self.members = sorted(set(members))
+        self._ring = {}
+        for member in self.members:
+            for idx in range(replicas):
+                key = self._hash('{}-{}'.format(member, idx))
+                self._ring[key] = member
+        self._keys = sorted(self._ring)
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest(), 16)
+
+    def get_member(self, key):
+        """Return the member owning a key.
+
+        :param key: Key to look for.
+        :return str: Name of the member, None if the ring is empty.
+        """
+        if not self._keys:
+            return None
+        pos = bisect.bisect(self._keys, self._hash(key))
+        return self._ring[self._keys[pos % len(self._keys)]]
+
+
+class TenantPartitioner(object):
+    """Split the tenant list between live processors.
+
+    :param member_id: Name of this processor.
+    """
+
+    def __init__(self, member_id):
+        self._member_id = member_id
+        self._membership = db_api.get_instance().get_processor_membership()
+        self._ring = HashRing([member_id])
+        self._heartbeat_thread = None
+        self._leases = set()
+
+    def _heartbeat_loop(self):
+        while True:
+            eventlet.sleep(CONF.orchestrator.heartbeat_interval)
+            try:
+                self.heartbeat()
+                # Notice members changes in the middle of a pass
+                self.refresh()
+            except Exception as e:
+                LOG.warn('Error while sending heartbeat: %s', e)
+
+    def start(self):
+        """Join the group and start sending heartbeats."""
+        self.heartbeat()
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = eventlet.spawn(self._heartbeat_loop)
+
+    def stop(self):
+        """Stop sending heartbeats and leave the group."""
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.kill()
+            self._heartbeat_thread = None
+        for tenant_id in list(self._leases):
+            self.release(tenant_id)
+        self._membership.leave(self._member_id)
+
+    def heartbeat(self):
+        self._membership.heartbeat(self._member_id)
+        # Keep the leases of the tenants being processed alive
+        for tenant_id in list(self._leases):
+            self._membership.acquire_lease(tenant_id,
+                                           self._member_id,
+                                           CONF.orchestrator.member_timeout)
+
+    def acquire(self, tenant_id):
+        """Lease a tenant before processing it.
+
+        :param tenant_id: Tenant to lease.
+        :return bool: False if another processor holds the tenant.
+        """
+        if self._membership.acquire_lease(tenant_id,
+                                          self._member_id,
+                                          CONF.orchestrator.member_timeout):
+            self._leases.add(tenant_id)
+            return True
+        return False
+
+    def release(self, tenant_id):
+        """Release the lease of a tenant.
+
+        :param tenant_id: Tenant to release.
+        """
+        self._leases.discard(tenant_id)
+        self._membership.release_lease(tenant_id, self._member_id)
+
+    def get_members(self):
+        members = self._membership.list_members(
+            CONF.orchestrator.member_timeout)
+        if self._member_id not in members:
+            members.append(self._member_id)
+        return sorted(members)
+
+    def refresh(self):
+        """Rebuild the hash ring if members joined or left."""
+        members = self.get_members()
+        if members != self._ring.members:
+            LOG.info('Processor members changed, rebalancing tenants '
+                     'between: %s', ', '.join(members))
+            self._ring = HashRing(members)
+
+    def is_mine(self, tenant_id):
+        return self._ring.get_member(tenant_id) == self._member_id
+
+    def filter_tenants(self, tenants):
+        """Return the tenants this processor is responsible for.
+
+        :param tenants: Complete list of tenants.
+        """
+        self.refresh()
+        return [tenant for tenant in tenants if self.is_mine(tenant)]
@@ -161,3 +161,52 @@ class ServiceToCollectorMapping(object):
         """Remove a mapping.
 
         """
+
+
+@six.add_metaclass(abc.ABCMeta)
+class ProcessorMembership(object):
+    """Base class for processor membership tracking."""
+
+    @abc.abstractmethod
+    def heartbeat(self, name):
+        """Register a member or refresh its heartbeat.
+
+        :param name: Name of the member.
+        """
+
+    @abc.abstractmethod
+    def list_members(self, timeout):
+        """Retrieve the list of live members.
+
+        :param timeout: Number of seconds after which a member without
+        heartbeat is considered dead.
+        :return list(str): Sorted list of members' name.
+        """
+
+    @abc.abstractmethod
+    def leave(self, name):
+        """Remove a member.
+
+        :param name: Name of the member.
+        """
+
+    @abc.abstractmethod
+    def acquire_lease(self, tenant_id, name, duration):
+        """Take or renew the lease of a tenant.
+
+        The lease is granted if it is free, expired or already held by the
+        member.
+
+        :param tenant_id: Tenant to lease.
+        :param name: Name of the member.
+        :param duration: Number of seconds the lease is valid.
+        :return bool: True if the member holds the lease.
+        """
+
+    @abc.abstractmethod
+    def release_lease(self, tenant_id, name):
+        """Release the lease of a tenant if held by the member.
+
+        :param tenant_id: Tenant to release.
+        :param name: Name of the member.
+        """
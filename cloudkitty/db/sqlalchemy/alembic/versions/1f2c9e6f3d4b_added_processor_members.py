@@ -0,0 +1,25 @@
+"""Added processor members.
+
+Revision ID: 1f2c9e6f3d4b
+Revises: 385e33fef139
+Create Date: 2015-10-12 14:08:31.612457
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1f2c9e6f3d4b'
+down_revision = '385e33fef139'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('processor_members',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('heartbeat', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name'))
+
+
+def downgrade():
+    op.drop_table('processor_members')
@@ -0,0 +1,26 @@
+"""Added tenant leases.
+
+Revision ID: ab60f89d7d35
+Revises: 1f2c9e6f3d4b
+Create Date: 2015-10-26 10:12:47.341027
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'ab60f89d7d35'
+down_revision = '1f2c9e6f3d4b'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('tenant_leases',
+    sa.Column('tenant_id', sa.String(length=255), nullable=False),
+    sa.Column('owner', sa.String(length=255), nullable=False),
+    sa.Column('expiration', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id'))
+
+
+def downgrade():
+    op.drop_table('tenant_leases')
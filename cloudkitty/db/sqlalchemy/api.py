@@ -15,7 +15,10 @@
 #
 # @author: Stéphane Albert
 #
+import datetime
+
 from oslo_config import cfg
+from oslo_db import exception
 from oslo_db.sqlalchemy import utils
 import sqlalchemy
 
@@ -24,6 +27,7 @@ from cloudkitty import db
 from cloudkitty.db import api
 from cloudkitty.db.sqlalchemy import migration
 from cloudkitty.db.sqlalchemy import models
+from cloudkitty import utils as ck_utils
 
 CONF = cfg.CONF
 
@@ -219,6 +223,82 @@ class ServiceToCollectorMapping(object):
             raise api.NoSuchMapping(service)
 
 
+class ProcessorMembership(api.ProcessorMembership):
+    """Database backed processor membership."""
+
+    def heartbeat(self, name):
+        session = db.get_session()
+        with session.begin():
+            try:
+                q = utils.model_query(
+                    models.ProcessorMember,
+                    session)
+                q = q.filter(models.ProcessorMember.name == name)
+                q = q.with_lockmode('update')
+                db_member = q.one()
+                db_member.heartbeat = ck_utils.utcnow()
+            except sqlalchemy.orm.exc.NoResultFound:
+                db_member = models.ProcessorMember(
+                    name=name,
+                    heartbeat=ck_utils.utcnow())
+                session.add(db_member)
+
+    def list_members(self, timeout):
+        session = db.get_session()
+        limit = ck_utils.utcnow() - datetime.timedelta(seconds=timeout)
+        q = utils.model_query(
+            models.ProcessorMember,
+            session)
+        q = q.filter(models.ProcessorMember.heartbeat >= limit)
+        q = q.order_by(models.ProcessorMember.name)
+        return [member.name for member in q.all()]
+
+    def leave(self, name):
+        session = db.get_session()
+        q = utils.model_query(
+            models.ProcessorMember,
+            session)
+        q = q.filter(models.ProcessorMember.name == name)
+        q.delete()
+
+    def acquire_lease(self, tenant_id, name, duration):
+        session = db.get_session()
+        now = ck_utils.utcnow()
+        expiration = now + datetime.timedelta(seconds=duration)
+        try:
+            with session.begin():
+                q = utils.model_query(
+                    models.TenantLease,
+                    session)
+                q = q.filter(models.TenantLease.tenant_id == tenant_id)
+                q = q.with_lockmode('update')
+                db_lease = q.first()
+                if db_lease is None:
+                    db_lease = models.TenantLease(
+                        tenant_id=tenant_id,
+                        owner=name,
+                        expiration=expiration)
+                    session.add(db_lease)
+                elif db_lease.owner == name or db_lease.expiration < now:
+                    db_lease.owner = name
+                    db_lease.expiration = expiration
+                else:
+                    return False
+        except exception.DBDuplicateEntry:
+            # Another member created the lease at the same time
+            return False
+        return True
+
+    def release_lease(self, tenant_id, name):
+        session = db.get_session()
+        q = utils.model_query(
+            models.TenantLease,
+            session)
+        q = q.filter(models.TenantLease.tenant_id == tenant_id)
+        q = q.filter(models.TenantLease.owner == name)
+        q.delete()
+
+
 class DBAPIManager(object):
 
     @staticmethod
@@ -237,6 +317,10 @@ class DBAPIManager(object):
     def get_service_to_collector_mapping():
         return ServiceToCollectorMapping()
 
+    @staticmethod
+    def get_processor_membership():
+        return ProcessorMembership()
+
     @staticmethod
     def get_migration():
         return migration
@@ -100,3 +100,44 @@ class ServiceToCollectorMapping(Base, models.ModelBase):
         for c in self.__table__.columns:
             d[c.name] = self[c.name]
         return d
+
+
+class ProcessorMember(Base, models.ModelBase):
+    """Processor membership.
+
+    """
+
+    __tablename__ = 'processor_members'
+
+    name = sqlalchemy.Column(sqlalchemy.String(255),
+                             primary_key=True)
+    heartbeat = sqlalchemy.Column(sqlalchemy.DateTime,
+                                  nullable=False)
+
+    def __repr__(self):
+        return ('<ProcessorMember[{name}]: '
+                'heartbeat={heartbeat}>').format(
+                    name=self.name,
+                    heartbeat=self.heartbeat)
+
+
+class TenantLease(Base, models.ModelBase):
+    """Lease of a tenant held by a processor.
+
+    """
+
+    __tablename__ = 'tenant_leases'
+
+    tenant_id = sqlalchemy.Column(sqlalchemy.String(255),
+                                  primary_key=True)
+    owner = sqlalchemy.Column(sqlalchemy.String(255),
+                              nullable=False)
+    expiration = sqlalchemy.Column(sqlalchemy.DateTime,
+                                   nullable=False)
+
+    def __repr__(self):
+        return ('<TenantLease[{tenant}]: '
+                'owner={owner} expiration={expiration}>').format(
+                    tenant=self.tenant_id,
+                    owner=self.owner,
+                    expiration=self.expiration)
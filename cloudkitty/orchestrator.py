@@ -27,8 +27,10 @@ from stevedore import driver
 from stevedore import extension
 
 from cloudkitty import collector
+from cloudkitty.collector import replay
 from cloudkitty.common import rpc
 from cloudkitty import config  # noqa
+from cloudkitty import coordination
 from cloudkitty import extension_manager
 from cloudkitty import utils as ck_utils
 
@@ -39,6 +41,9 @@ LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 CONF.import_opt('backend', 'cloudkitty.storage', 'storage')
 CONF.import_opt('backend', 'cloudkitty.tenant_fetcher', 'tenant_fetcher')
+CONF.import_opt('max_workers', 'cloudkitty.config', 'orchestrator')
+CONF.import_opt('max_service_workers', 'cloudkitty.config', 'orchestrator')
+CONF.import_opt('heartbeat_interval', 'cloudkitty.config', 'orchestrator')
 
 COLLECTORS_NAMESPACE = 'cloudkitty.collector.backends'
 FETCHERS_NAMESPACE = 'cloudkitty.tenant.fetchers'
@@ -104,6 +109,28 @@ class RatingEndpoint(object):
                 self._pending_reload.remove(name)
 
 
+class CollectorEndpoint(object):
+    target = messaging.Target(namespace='collector',
+                              version='1.0')
+
+    def __init__(self, orchestrator):
+        self._pending_refresh = False
+        self._orchestrator = orchestrator
+
+    def get_pending_refresh(self):
+        lock = lockutils.lock('collector-refresh')
+        with lock:
+            pending_refresh = self._pending_refresh
+            self._pending_refresh = False
+            return pending_refresh
+
+    def refresh(self, ctxt):
+        LOG.info('Received collector refresh command.')
+        lock = lockutils.lock('collector-refresh')
+        with lock:
+            self._pending_refresh = True
+
+
 class BaseWorker(object):
     def __init__(self, tenant_id=None):
         self._tenant_id = tenant_id
@@ -141,12 +168,16 @@ class APIWorker(BaseWorker):
 
 
 class Worker(BaseWorker):
-    def __init__(self, collector, storage, tenant_id=None):
+    def __init__(self, collector, storage, tenant_id=None, partitioner=None):
         self._collector = collector
         self._storage = storage
+        self._partitioner = partitioner
 
         self._period = CONF.collect.period
         self._wait_time = CONF.collect.wait_periods * self._period
+        self._catchup_periods = CONF.collect.catchup_periods
+        self._prefetched_until = 0
+        self._pool = eventlet.GreenPool(CONF.orchestrator.max_service_workers)
 
         super(Worker, self).__init__(tenant_id)
 
@@ -174,23 +205,87 @@ class Worker(BaseWorker):
             return next_timestamp
         return 0
 
+    def _is_mine(self):
+        if self._partitioner is None:
+            return True
+        return self._partitioner.is_mine(self._tenant_id)
+
+    def _get_due_periods(self, timestamp):
+        """Return the number of collectable periods from timestamp."""
+        now = ck_utils.utcnow_ts()
+        late = now - self._wait_time - timestamp
+        if late <= 0:
+            return 0
+        return (late - 1) // self._period + 1
+
+    def _prefetch_service(self, service, start, end):
+        try:
+            self._collector.prefetch(service, start, end, self._tenant_id)
+        except Exception as e:
+            LOG.warn('Error while prefetching service %(service)s: '
+                     '%(error)s', {'service': service, 'error': e})
+
+    def _prefetch(self, timestamp):
+        """Ask the collector for several periods at once when late."""
+        if self._catchup_periods <= 1 or timestamp < self._prefetched_until:
+            return
+        periods = min(self._get_due_periods(timestamp), self._catchup_periods)
+        if periods <= 1:
+            return
+        end = timestamp + periods * self._period
+        services = CONF.collect.services
+        for _ in self._pool.imap(self._prefetch_service,
+                                 services,
+                                 [timestamp] * len(services),
+                                 [end] * len(services)):
+            pass
+        self._prefetched_until = end
+
+    def _collect_service(self, service, timestamp):
+        try:
+            return self._collect(service, timestamp)
+        except collector.NoDataCollected:
+            return None
+        except Exception as e:
+            LOG.warn('Error while collecting service %(service)s: '
+                     '%(error)s', {'service': service, 'error': e})
+            return None
+
+    def _clear_prefetched(self):
+        if not self._prefetched_until:
+            return
+        self._prefetched_until = 0
+        try:
+            self._collector.clear_prefetched(self._tenant_id)
+        except Exception as e:
+            LOG.warn('Error while clearing prefetched data: %s', e)
+
     def run(self):
+        try:
+            self._run_periods()
+        finally:
+            # The catch-up may stop before every prefetched period is used
+            self._clear_prefetched()
+
+    def _run_periods(self):
         while True:
             timestamp = self.check_state()
             if not timestamp:
                 break
+            if not self._is_mine():
+                LOG.info('Tenant %s moved to another processor.',
+                         self._tenant_id)
+                break
 
-            for service in CONF.collect.services:
-                try:
-                    try:
-                        data = self._collect(service, timestamp)
-                    except collector.NoDataCollected:
-                        raise
-                    except Exception as e:
-                        LOG.warn('Error while collecting service %(service)s: '
-                                 '%(error)s', {'service': service, 'error': e})
-                        raise collector.NoDataCollected('', service)
-                except collector.NoDataCollected:
+            self._prefetch(timestamp)
+            services = CONF.collect.services
+            # Results are yielded in the services order whatever the order
+            # in which the collection finished.
+            results = self._pool.imap(self._collect_service,
+                                      services,
+                                      [timestamp] * len(services))
+            for service, data in zip(services, results):
+                if data is None:
                     begin = timestamp
                     end = begin + self._period
                     for processor in self._processors:
@@ -207,6 +302,35 @@ class Worker(BaseWorker):
             self._storage.commit(self._tenant_id)
 
 
+class SchedulingStats(object):
+    """Track the delay between a period becoming due and its processing."""
+
+    def __init__(self):
+        self.count = 0
+        self.last = 0
+        self.max = 0
+        self.total = 0
+
+    def add(self, lag):
+        lag = max(lag, 0)
+        self.count += 1
+        self.last = lag
+        self.max = max(self.max, lag)
+        self.total += lag
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0
+        return float(self.total) / self.count
+
+    def as_dict(self):
+        return {'count': self.count,
+                'last': self.last,
+                'max': self.max,
+                'mean': self.mean}
+
+
 class Orchestrator(object):
     def __init__(self):
         # Tenant fetcher
@@ -226,6 +350,10 @@ class Orchestrator(object):
             CONF.collect.collector,
             invoke_on_load=True,
             invoke_kwds=collector_args).driver
+        if CONF.replay_collector.record_file:
+            self.collector = replay.RecordingCollector(
+                self.collector,
+                CONF.replay_collector.record_file)
 
         storage_args = {'period': CONF.collect.period}
         self.storage = driver.DriverManager(
@@ -234,13 +362,33 @@ class Orchestrator(object):
             invoke_on_load=True,
             invoke_kwds=storage_args).driver
 
+        # Tenants partitioning
+        self.partitioner = coordination.TenantPartitioner(CONF.host)
+        self.partitioner.start()
+
+        # Workers
+        self._pool = eventlet.GreenPool(CONF.orchestrator.max_workers)
+        self._terminate = False
+        self._failed_tenants = set()
+
+        # Scheduling
+        self._tenants = []
+        self._managed_tenants = []
+        self._leased_tenants = set()
+        self.scheduling_lag = SchedulingStats()
+
         # RPC
         self.server = None
         self._rating_endpoint = RatingEndpoint(self)
+        self._collector_endpoint = CollectorEndpoint(self)
         self._init_messaging()
 
     def _load_tenant_list(self):
-        self._tenants = self.fetcher.get_tenants()
+        tenants = self.fetcher.get_tenants()
+        self._managed_tenants = self.partitioner.filter_tenants(tenants)
+        self._tenants = self._managed_tenants[:]
+        self._failed_tenants.clear()
+        self._leased_tenants.clear()
 
     def _init_messaging(self):
         target = messaging.Target(topic='cloudkitty',
@@ -248,23 +396,77 @@ class Orchestrator(object):
                                   version='1.0')
         endpoints = [
             self._rating_endpoint,
+            self._collector_endpoint,
         ]
         self.server = rpc.get_server(target, endpoints)
         self.server.start()
 
-    def _check_state(self, tenant_id):
+    def _get_due_time(self, tenant_id):
+        """Return when the next period of a tenant becomes collectable.
+
+        :param tenant_id: Tenant to check.
+        :return: Timestamp, None if the tenant was never processed.
+        """
         timestamp = self.storage.get_state(tenant_id)
         if not timestamp:
+            return None
+        wait_time = CONF.collect.wait_periods * CONF.collect.period
+        # A period is collectable once next_timestamp + wait_time < now
+        return timestamp + CONF.collect.period + wait_time + 1
+
+    def _check_state(self, tenant_id):
+        due_time = self._get_due_time(tenant_id)
+        if due_time is None:
             month_start = ck_utils.get_month_start()
             return ck_utils.dt2ts(month_start)
 
         now = ck_utils.utcnow_ts()
-        next_timestamp = timestamp + CONF.collect.period
-        wait_time = CONF.collect.wait_periods * CONF.collect.period
-        if next_timestamp + wait_time < now:
-            return next_timestamp
+        if due_time <= now:
+            self.scheduling_lag.add(now - due_time)
+            wait_time = CONF.collect.wait_periods * CONF.collect.period
+            return due_time - wait_time - 1
         return 0
 
+    def _get_next_run(self):
+        """Return the timestamp of the next processing pass.
+
+        The processor wakes up as soon as one of its tenants has a
+        collectable period, or on the next period boundary to refresh the
+        tenant list.
+        """
+        now = ck_utils.utcnow_ts()
+        period = CONF.collect.period
+        # Periods are aligned so they become collectable one second after
+        # a boundary, see _get_due_time.
+        next_run = (now // period + 1) * period + 1
+        for tenant in self._managed_tenants:
+            # Failed tenants are retried on the next period boundary
+            if tenant in self._failed_tenants:
+                continue
+            # Tenants moved to another processor are dropped on the next
+            # period boundary
+            if not self.partitioner.is_mine(tenant):
+                continue
+            # The previous owner releases the tenant once it has noticed the
+            # new members, after a heartbeat.
+            if tenant in self._leased_tenants:
+                next_run = min(next_run,
+                               now + CONF.orchestrator.heartbeat_interval)
+                continue
+            due_time = self._get_due_time(tenant)
+            if due_time is None:
+                continue
+            next_run = min(next_run, due_time)
+        return next_run
+
+    def _wait_next_run(self):
+        next_run = self._get_next_run()
+        delay = max(next_run - ck_utils.utcnow_ts(), 0)
+        LOG.debug('Next processing pass in %(delay)ds, scheduling lag: '
+                  '%(lag)s', {'delay': delay,
+                              'lag': self.scheduling_lag.as_dict()})
+        eventlet.sleep(delay)
+
     def _collect(self, service, start_timestamp):
         next_timestamp = start_timestamp + CONF.collect.period
         raw_data = self.collector.retrieve(service,
@@ -292,23 +494,76 @@ class Orchestrator(object):
         # reloading
         # pending_reload = self._rating_endpoint.get_reload_list()
         # pending_states = self._rating_endpoint.get_module_state()
-        pass
+        # Only called between two passes, no worker is using the collector
+        if self._collector_endpoint.get_pending_refresh():
+            LOG.info('Refreshing collector configuration.')
+            try:
+                self.collector.refresh()
+            except Exception:
+                LOG.exception('Error while refreshing the collector, '
+                              'keeping the previous configuration.')
+
+    def _run_worker(self, tenant_id):
+        acquired = False
+        try:
+            acquired = self.partitioner.acquire(tenant_id)
+            if not acquired:
+                LOG.info('Tenant %s is still processed by another processor.',
+                         tenant_id)
+                self._leased_tenants.add(tenant_id)
+                if tenant_id in self._tenants:
+                    self._tenants.remove(tenant_id)
+                return
+            worker = Worker(self.collector,
+                            self.storage,
+                            tenant_id,
+                            self.partitioner)
+            worker.run()
+        except Exception:
+            LOG.exception('Error while processing tenant %s.', tenant_id)
+            # Don't try again during this pass
+            self._failed_tenants.add(tenant_id)
+            if tenant_id in self._tenants:
+                self._tenants.remove(tenant_id)
+        finally:
+            if acquired:
+                self._release_tenant(tenant_id)
+
+    def _release_tenant(self, tenant_id):
+        try:
+            self.partitioner.release(tenant_id)
+        except Exception:
+            # The lease expires on its own after member_timeout
+            LOG.exception('Error while releasing tenant %s.', tenant_id)
+
+    def _process_tenants(self):
+        while len(self._tenants) and not self._terminate:
+            for tenant in self._tenants[:]:
+                if self._terminate:
+                    break
+                # The ring is refreshed by the heartbeats during the pass
+                if not self.partitioner.is_mine(tenant):
+                    self._tenants.remove(tenant)
+                elif not self._check_state(tenant):
+                    self._tenants.remove(tenant)
+                else:
+                    # Blocks while the pool is full
+                    self._pool.spawn_n(self._run_worker, tenant)
+            # Wait for every worker before checking states again so a
+            # tenant is never processed by two workers at the same time.
+            self._pool.waitall()
 
     def process(self):
-        while True:
+        while not self._terminate:
             self.process_messages()
             self._load_tenant_list()
-            while len(self._tenants):
-                for tenant in self._tenants[:]:
-                    if not self._check_state(tenant):
-                        self._tenants.remove(tenant)
-                    else:
-                        worker = Worker(self.collector,
-                                        self.storage,
-                                        tenant)
-                        worker.run()
-            # FIXME(sheeprine): We may cause a drift here
-            eventlet.sleep(CONF.collect.period)
+            self._process_tenants()
+            if not self._terminate:
+                self._wait_next_run()
 
     def terminate(self):
-        pass
+        self._terminate = True
+        LOG.info('Waiting for %d running workers to finish.',
+                 self._pool.running())
+        self._pool.waitall()
+        self.partitioner.stop()
@@ -15,12 +15,54 @@
 #
 # @author: Stéphane Albert
 #
+import bisect
 import decimal
 
+from oslo_concurrency import lockutils
+
 from cloudkitty import rating
 from cloudkitty.rating.hash.controllers import root as root_api
 from cloudkitty.rating.hash.db import api as hash_db_api
 
+# Rates shared by every HashMap instance of the process, rebuilt when their
+# generation in database changes.
+_RATES_CACHE = {'generation': None, 'entries': {}}
+# Column value of items without the field
+_MISSING = object()
+
+
+def _column_key(value):
+    if isinstance(value, decimal.Decimal):
+        # Decimals with different exponents are equal but don't give the
+        # same results
+        return decimal.Decimal, str(value)
+    return type(value), value
+
+
+class ThresholdGroup(dict):
+    """Thresholds of a group, keyed by level.
+
+    Levels are sorted at creation to find the threshold reached by a value
+    with a binary search, the group must not be modified afterwards.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ThresholdGroup, self).__init__(*args, **kwargs)
+        self.default = self.get('_DEFAULT_', {})
+        self.levels = sorted(level for level in self if level != '_DEFAULT_')
+
+    def find(self, value):
+        """Return the highest level reached by value and its threshold.
+
+        :param value: Value to compare to the levels.
+        :return: (level, threshold) or (None, None) if no level is reached.
+        """
+        index = bisect.bisect_right(self.levels, value)
+        if not index:
+            return None, None
+        level = self.levels[index - 1]
+        return level, self[level]
+
 
 class HashMap(rating.RatingProcessorBase):
     """HashMap rating module.
@@ -46,27 +88,38 @@ class HashMap(rating.RatingProcessorBase):
         """Reload the module's configuration.
 
         """
-        self._load_rates()
+        self._load_rates(force=True)
+
+    @staticmethod
+    def _add_mapping(mappings, group_name, value, map_type, cost):
+        if group_name is None:
+            group_name = '_DEFAULT_'
+        current_scope = mappings.setdefault(group_name, {})
+        if value:
+            current_scope = current_scope.setdefault(value, {})
+        current_scope['type'] = map_type
+        current_scope['cost'] = cost
+
+    @staticmethod
+    def _add_threshold(thresholds, group_name, level, map_type, cost):
+        if group_name is None:
+            group_name = '_DEFAULT_'
+        current_scope = thresholds.setdefault(group_name, {})
+        current_scope[level] = {'type': map_type, 'cost': cost}
 
     def _load_mappings(self, mappings_uuid_list):
         hashmap = hash_db_api.get_instance()
         mappings = {}
         for mapping_uuid in mappings_uuid_list:
             mapping_db = hashmap.get_mapping(uuid=mapping_uuid)
+            group_name = None
             if mapping_db.group_id:
                 group_name = mapping_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in mappings:
-                mappings[group_name] = {}
-            current_scope = mappings[group_name]
-
-            mapping_value = mapping_db.value
-            if mapping_value:
-                current_scope[mapping_value] = {}
-                current_scope = current_scope[mapping_value]
-            current_scope['type'] = mapping_db.map_type
-            current_scope['cost'] = mapping_db.cost
+            self._add_mapping(mappings,
+                              group_name,
+                              mapping_db.value,
+                              mapping_db.map_type,
+                              mapping_db.cost)
         return mappings
 
     def _load_thresholds(self, thresholds_uuid_list):
@@ -74,64 +127,76 @@ class HashMap(rating.RatingProcessorBase):
         thresholds = {}
         for threshold_uuid in thresholds_uuid_list:
             threshold_db = hashmap.get_threshold(uuid=threshold_uuid)
+            group_name = None
             if threshold_db.group_id:
                 group_name = threshold_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in thresholds:
-                thresholds[group_name] = {}
-            current_scope = thresholds[group_name]
-
-            threshold_level = threshold_db.level
-            current_scope[threshold_level] = {}
-            current_scope = current_scope[threshold_level]
-            current_scope['type'] = threshold_db.map_type
-            current_scope['cost'] = threshold_db.cost
+            self._add_threshold(thresholds,
+                                group_name,
+                                threshold_db.level,
+                                threshold_db.map_type,
+                                threshold_db.cost)
         return thresholds
 
-    def _load_service_entries(self, service_name, service_uuid):
-        hashmap = hash_db_api.get_instance()
-        self._entries[service_name] = {}
-        mappings_uuid_list = hashmap.list_mappings(
-            service_uuid=service_uuid)
-        mappings = self._load_mappings(mappings_uuid_list)
-        self._entries[service_name]['mappings'] = mappings
-        thresholds_uuid_list = hashmap.list_thresholds(
-            service_uuid=service_uuid)
-        thresholds = self._load_thresholds(thresholds_uuid_list)
-        self._entries[service_name]['thresholds'] = thresholds
-
-    def _load_field_entries(self, service_name, field_name, field_uuid):
-        hashmap = hash_db_api.get_instance()
-        mappings_uuid_list = hashmap.list_mappings(field_uuid=field_uuid)
-        mappings = self._load_mappings(mappings_uuid_list)
-        thresholds_uuid_list = hashmap.list_thresholds(field_uuid=field_uuid)
-        thresholds = self._load_thresholds(thresholds_uuid_list)
-        if service_name not in self._entries:
-            self._entries[service_name] = {}
-        if 'fields' not in self._entries[service_name]:
-            self._entries[service_name]['fields'] = {}
-        scope = self._entries[service_name]['fields'][field_name] = {}
-        scope['mappings'] = mappings
-        scope['thresholds'] = thresholds
+    def _load_rates(self, force=False):
+        """Use the shared rates, rebuild them if they changed.
 
-    def _load_rates(self):
-        self._entries = {}
-        hashmap = hash_db_api.get_instance()
-        services_uuid_list = hashmap.list_services()
-        for service_uuid in services_uuid_list:
-            service_db = hashmap.get_service(uuid=service_uuid)
-            service_name = service_db.name
-            self._load_service_entries(service_name, service_uuid)
-            fields_uuid_list = hashmap.list_fields(service_uuid)
-            for field_uuid in fields_uuid_list:
-                field_db = hashmap.get_field(uuid=field_uuid)
-                field_name = field_db.name
-                self._load_field_entries(service_name, field_name, field_uuid)
+        :param force: Rebuild the rates even if their generation is the same.
+        """
+        with lockutils.lock('hashmap-rates'):
+            generation = hash_db_api.get_instance().get_generation()
+            if force or generation != _RATES_CACHE['generation']:
+                _RATES_CACHE['entries'] = self._build_entries()
+                _RATES_CACHE['generation'] = generation
+            self._entries = _RATES_CACHE['entries']
 
-    def add_rating_informations(self, data):
-        if 'rating' not in data:
-            data['rating'] = {'price': 0}
+    def _build_entries(self):
+        """Load every rate in a few queries and build the entries."""
+        entries = {}
+        rates = hash_db_api.get_instance().list_rates()
+        scopes = {'service': {}, 'field': {}}
+        for service in rates['services']:
+            scope = entries[service.name] = {'mappings': {},
+                                             'thresholds': {}}
+            scopes['service'][service.id] = scope
+        for field in rates['fields']:
+            service_entries = scopes['service'][field.service_id]
+            service_fields = service_entries.setdefault('fields', {})
+            scope = service_fields[field.name] = {'mappings': {},
+                                                  'thresholds': {}}
+            scopes['field'][field.id] = scope
+        for mapping in rates['mappings']:
+            if mapping.field_id:
+                scope = scopes['field'][mapping.field_id]
+            else:
+                scope = scopes['service'][mapping.service_id]
+            self._add_mapping(scope['mappings'],
+                              mapping.group_name,
+                              mapping.value,
+                              mapping.map_type,
+                              mapping.cost)
+        for threshold in rates['thresholds']:
+            if threshold.field_id:
+                scope = scopes['field'][threshold.field_id]
+            else:
+                scope = scopes['service'][threshold.service_id]
+            self._add_threshold(scope['thresholds'],
+                                threshold.group_name,
+                                threshold.level,
+                                threshold.map_type,
+                                threshold.cost)
+        for scope_type in scopes.values():
+            for scope in scope_type.values():
+                scope['thresholds'] = dict(
+                    (group_name, ThresholdGroup(thresholds))
+                    for group_name, thresholds in scope['thresholds'].items())
+        return entries
+
+    def _get_prices(self, qty):
+        """Return the price of each group of the current result.
+
+        :param qty: Quantity of the rated item.
+        """
+        prices = []
         for entry in self._res.values():
             rate = entry['rate']
             flat = entry['flat']
@@ -142,13 +207,20 @@ class HashMap(rating.RatingProcessorBase):
                     rate *= entry['threshold']['cost']
             res = rate * flat
             # FIXME(sheeprine): Added here to ensure that qty is decimal
-            res *= decimal.Decimal(data['vol']['qty'])
+            res *= decimal.Decimal(qty)
             if entry['threshold']['scope'] == 'service':
                 if entry['threshold']['type'] == 'flat':
                     res += entry['threshold']['cost']
                 else:
                     res *= entry['threshold']['cost']
-            data['rating']['price'] += res
+            prices.append(res)
+        return prices
+
+    def add_rating_informations(self, data):
+        if 'rating' not in data:
+            data['rating'] = {'price': 0}
+        for price in self._get_prices(data['vol']['qty']):
+            data['rating']['price'] += price
 
     def update_result(self,
                       group,
@@ -185,43 +257,38 @@ class HashMap(rating.RatingProcessorBase):
                          mapping_groups,
                          cmp_value):
         for group_name, mappings in mapping_groups.items():
-            mapping_default = mappings.get('_DEFAULT_', {})
-            matched = False
-            for mapping_value, mapping in mappings.items():
-                if mapping is mapping_default:
-                    continue
-                if cmp_value == mapping_value:
-                    self.update_result(
-                        group_name,
-                        mapping['type'],
-                        mapping['cost'])
-                    matched = True
-            if not matched and mapping_default:
+            try:
+                mapping = mappings.get(cmp_value)
+            except TypeError:
+                # Unhashable values can't match any mapping
+                mapping = None
+            if mapping is None:
+                mapping = mappings.get('_DEFAULT_')
+            if mapping:
                 self.update_result(
                     group_name,
-                    mapping_default['type'],
-                    mapping_default['cost'])
+                    mapping['type'],
+                    mapping['cost'])
 
     def process_thresholds(self,
                            threshold_groups,
                            cmp_level,
                            threshold_type):
         for group_name, thresholds in threshold_groups.items():
-            threshold_default = thresholds.get('_DEFAULT_', {})
-            matched = False
-            for threshold_level, threshold in thresholds.items():
-                if threshold is threshold_default:
-                    continue
-                if cmp_level >= threshold_level:
-                    self.update_result(
-                        group_name,
-                        threshold['type'],
-                        threshold['cost'],
-                        threshold_level,
-                        True,
-                        threshold_type)
-                    matched = True
-            if not matched and threshold_default:
+            if not isinstance(thresholds, ThresholdGroup):
+                thresholds = ThresholdGroup(thresholds)
+            # Only the highest level reached is kept by update_result
+            threshold_level, threshold = thresholds.find(cmp_level)
+            if threshold is not None:
+                self.update_result(
+                    group_name,
+                    threshold['type'],
+                    threshold['cost'],
+                    threshold_level,
+                    True,
+                    threshold_type)
+            elif thresholds.default:
+                threshold_default = thresholds.default
                 self.update_result(
                     group_name,
                     threshold_default['type'],
@@ -260,13 +327,43 @@ class HashMap(rating.RatingProcessorBase):
                                         decimal.Decimal(cmp_value),
                                         'field')
 
+    def process_items(self, service_name, items):
+        """Rate every item of a service.
+
+        Items are split in columns, one per field of the service plus the
+        quantities. Items with the same values in every column get the same
+        group prices, which are only computed for the first of them.
+
+        :param service_name: Name of the service.
+        :param items: Items of the service.
+        """
+        fields = list(self._entries.get(service_name, {}).get('fields', {}))
+        columns = [[_column_key(item['desc'].get(field, _MISSING))
+                    for item in items]
+                   for field in fields]
+        columns.append([_column_key(item['vol']['qty']) for item in items])
+        prices_cache = {}
+        for item, key in zip(items, zip(*columns)):
+            try:
+                prices = prices_cache.get(key)
+            except TypeError:
+                # Unhashable values can't be cached
+                key = prices = None
+            if prices is None:
+                self._res = {}
+                self.process_services(service_name, item)
+                self.process_fields(service_name, item)
+                prices = self._get_prices(item['vol']['qty'])
+                if key is not None:
+                    prices_cache[key] = prices
+            if 'rating' not in item:
+                item['rating'] = {'price': 0}
+            for price in prices:
+                item['rating']['price'] += price
+
     def process(self, data):
         for cur_data in data:
             cur_usage = cur_data['usage']
             for service_name, service_data in cur_usage.items():
-                for item in service_data:
-                    self._res = {}
-                    self.process_services(service_name, item)
-                    self.process_fields(service_name, item)
-                    self.add_rating_informations(item)
+                self.process_items(service_name, service_data)
         return data
@@ -256,6 +256,23 @@ class HashMap(object):
         :return list(str): List of thresholds' UUID.
         """
 
+    @abc.abstractmethod
+    def get_generation(self):
+        """Return the generation of the rates.
+
+        The generation is increased every time a service, field, group,
+        mapping or threshold is created, updated or deleted.
+        """
+
+    @abc.abstractmethod
+    def list_rates(self):
+        """Return every service, field, mapping and threshold at once.
+
+        :return dict: Rows keyed by object type (services, fields, mappings
+                      and thresholds), mappings and thresholds rows include
+                      the name of their group.
+        """
+
     @abc.abstractmethod
     def create_service(self, name):
         """Create a new service.
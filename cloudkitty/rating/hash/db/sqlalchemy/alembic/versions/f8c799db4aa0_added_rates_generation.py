@@ -0,0 +1,28 @@
+"""Added rates generation.
+
+Revision ID: f8c799db4aa0
+Revises: 54cc17accf2c
+Create Date: 2015-12-07 10:12:05.418213
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'f8c799db4aa0'
+down_revision = '54cc17accf2c'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    table = op.create_table('hashmap_generation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    mysql_charset='utf8',
+    mysql_engine='InnoDB')
+    op.bulk_insert(table, [{'id': 1, 'generation': 0}])
+
+
+def downgrade():
+    op.drop_table('hashmap_generation')
@@ -217,6 +217,49 @@ class HashMap(api.HashMap):
             models.HashMapThreshold.threshold_id)
         return [uuid[0] for uuid in res]
 
+    @staticmethod
+    def _bump_generation(session):
+        q = session.query(models.HashMapGeneration)
+        q.update({'generation': models.HashMapGeneration.generation + 1},
+                 synchronize_session=False)
+
+    def get_generation(self):
+        session = db.get_session()
+        q = session.query(models.HashMapGeneration)
+        return q.value(models.HashMapGeneration.generation)
+
+    def list_rates(self):
+        session = db.get_session()
+        # Only query columns, loading the models would trigger the
+        # immediate loading of their relationships.
+        services = session.query(
+            models.HashMapService.id,
+            models.HashMapService.name).all()
+        fields = session.query(
+            models.HashMapField.id,
+            models.HashMapField.service_id,
+            models.HashMapField.name).all()
+        mappings = session.query(
+            models.HashMapMapping.service_id,
+            models.HashMapMapping.field_id,
+            models.HashMapMapping.value,
+            models.HashMapMapping.map_type,
+            models.HashMapMapping.cost,
+            models.HashMapGroup.name.label('group_name'))
+        mappings = mappings.outerjoin(models.HashMapMapping.group).all()
+        thresholds = session.query(
+            models.HashMapThreshold.service_id,
+            models.HashMapThreshold.field_id,
+            models.HashMapThreshold.level,
+            models.HashMapThreshold.map_type,
+            models.HashMapThreshold.cost,
+            models.HashMapGroup.name.label('group_name'))
+        thresholds = thresholds.outerjoin(models.HashMapThreshold.group).all()
+        return {'services': services,
+                'fields': fields,
+                'mappings': mappings,
+                'thresholds': thresholds}
+
     def create_service(self, name):
         session = db.get_session()
         try:
@@ -224,6 +267,7 @@ class HashMap(api.HashMap):
                 service_db = models.HashMapService(name=name)
                 service_db.service_id = uuidutils.generate_uuid()
                 session.add(service_db)
+                self._bump_generation(session)
             return service_db
         except exception.DBDuplicateEntry:
             service_db = self.get_service(name=name)
@@ -241,6 +285,7 @@ class HashMap(api.HashMap):
                     name=name,
                     field_id=uuidutils.generate_uuid())
                 session.add(field_db)
+                self._bump_generation(session)
             # FIXME(sheeprine): backref are not populated as they used to be.
             #                   Querying the item again to get backref.
             field_db = self.get_field(service_uuid=service_uuid,
@@ -258,6 +303,7 @@ class HashMap(api.HashMap):
                     name=name,
                     group_id=uuidutils.generate_uuid())
                 session.add(group_db)
+                self._bump_generation(session)
             return group_db
         except exception.DBDuplicateEntry:
             raise api.GroupAlreadyExists(name, group_db.group_id)
@@ -302,6 +348,7 @@ class HashMap(api.HashMap):
                 if group_fk:
                     field_map.group_id = group_fk
                 session.add(field_map)
+                self._bump_generation(session)
         except exception.DBDuplicateEntry:
             raise api.MappingAlreadyExists(value, field_map.field_id)
         except exception.DBError:
@@ -345,6 +392,7 @@ class HashMap(api.HashMap):
                 if group_fk:
                     threshold_db.group_id = group_fk
                 session.add(threshold_db)
+                self._bump_generation(session)
         except exception.DBDuplicateEntry:
             raise api.ThresholdAlreadyExists(level, threshold_db.field_id)
         except exception.DBError:
@@ -383,6 +431,7 @@ class HashMap(api.HashMap):
                                 attribute))
                 else:
                     raise ValueError('No attribute to update.')
+                self._bump_generation(session)
                 return mapping_db
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchMapping(uuid)
@@ -415,6 +464,7 @@ class HashMap(api.HashMap):
                                 attribute))
                 else:
                     raise ValueError('No attribute to update.')
+                self._bump_generation(session)
                 return threshold_db
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchThreshold(uuid)
@@ -430,9 +480,11 @@ class HashMap(api.HashMap):
             q = q.filter(models.HashMapService.service_id == uuid)
         else:
             raise ValueError('You must specify either name or uuid.')
-        r = q.delete()
-        if not r:
-            raise api.NoSuchService(name, uuid)
+        with session.begin():
+            r = q.delete()
+            if not r:
+                raise api.NoSuchService(name, uuid)
+            self._bump_generation(session)
 
     def delete_field(self, uuid):
         session = db.get_session()
@@ -440,9 +492,11 @@ class HashMap(api.HashMap):
             models.HashMapField,
             session)
         q = q.filter(models.HashMapField.field_id == uuid)
-        r = q.delete()
-        if not r:
-            raise api.NoSuchField(uuid)
+        with session.begin():
+            r = q.delete()
+            if not r:
+                raise api.NoSuchField(uuid)
+            self._bump_generation(session)
 
     def delete_group(self, uuid, recurse=True):
         session = db.get_session()
@@ -461,6 +515,7 @@ class HashMap(api.HashMap):
                 for threshold in r.thresholds:
                     session.delete(threshold)
             q.delete()
+            self._bump_generation(session)
 
     def delete_mapping(self, uuid):
         session = db.get_session()
@@ -468,9 +523,11 @@ class HashMap(api.HashMap):
             models.HashMapMapping,
             session)
         q = q.filter(models.HashMapMapping.mapping_id == uuid)
-        r = q.delete()
-        if not r:
-            raise api.NoSuchMapping(uuid)
+        with session.begin():
+            r = q.delete()
+            if not r:
+                raise api.NoSuchMapping(uuid)
+            self._bump_generation(session)
 
     def delete_threshold(self, uuid):
         session = db.get_session()
@@ -478,6 +535,8 @@ class HashMap(api.HashMap):
             models.HashMapThreshold,
             session)
         q = q.filter(models.HashMapThreshold.threshold_id == uuid)
-        r = q.delete()
-        if not r:
-            raise api.NoSuchThreshold(uuid)
+        with session.begin():
+            r = q.delete()
+            if not r:
+                raise api.NoSuchThreshold(uuid)
+            self._bump_generation(session)
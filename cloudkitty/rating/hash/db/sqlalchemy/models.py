@@ -274,3 +274,21 @@ class HashMapThreshold(Base, HashMapBase):
                     map_type=self.map_type,
                     level=self.level,
                     cost=self.cost)
+
+
+class HashMapGeneration(Base, HashMapBase):
+    """Generation of the rates, increased on every rates change.
+
+    """
+    __tablename__ = 'hashmap_generation'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer,
+                           primary_key=True)
+    generation = sqlalchemy.Column(sqlalchemy.Integer,
+                                   nullable=False,
+                                   default=0)
+
+    def __repr__(self):
+        return ('<HashMapGeneration: '
+                'generation={generation}>').format(
+                    generation=self.generation)
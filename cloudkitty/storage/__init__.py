@@ -16,6 +16,7 @@
 # @author: Stéphane Albert
 #
 import abc
+import collections
 
 from oslo_config import cfg
 import six
@@ -212,6 +213,69 @@ class BaseStorage(object):
         :type res_type: str
         """
 
+    def iter_time_frame(self, begin, end, limit=None, marker=None,
+                        **filters):
+        """Iterate over a time frame from the storage backend.
+
+        Yield (marker, frame) tuples, the marker can be used to resume the
+        iteration after the frame it was returned with.
+
+        :param begin: When to start filtering.
+        :type begin: datetime.datetime
+        :param end: When to stop filtering.
+        :type end: datetime.datetime
+        :param limit: (Optional) Maximum number of frames to return.
+        :type limit: int
+        :param marker: (Optional) Marker of the last frame already returned.
+        :type marker: int
+        :param res_type: (Optional) Filter on the resource type.
+        :type res_type: str
+        :param tenant_id: (Optional) Filter on the tenant_id.
+        :type res_type: str
+        """
+        try:
+            frames = self.get_time_frame(begin, end, **filters)
+        except NoTimeFrame:
+            return
+        start = marker + 1 if marker is not None else 0
+        stop = start + limit if limit else None
+        for idx, frame in enumerate(frames[start:stop], start):
+            yield idx, frame
+
+    def iter_grouped_time_frame(self, begin, end, limit=None, marker=None,
+                                **filters):
+        """Iterate over a time frame, grouping resources by period and tenant.
+
+        Consecutive resources sharing the same period and tenant are merged
+        in a single frame. Resources keep the storage order, so a period and
+        tenant is split in several frames when resources of other periods or
+        tenants were stored in between, for example by concurrent workers.
+        Frames must not be expected to be unique per period and tenant.
+
+        The arguments are the same as iter_time_frame's, the limit still
+        applies to resources, not to the merged frames.
+        """
+        key = None
+        frame = None
+        last_marker = None
+        frames = self.iter_time_frame(begin, end, limit, marker, **filters)
+        for cur_marker, cur_frame in frames:
+            for service, resources in cur_frame['usage'].items():
+                for resource in resources:
+                    resource_key = (cur_frame['period']['begin'],
+                                    cur_frame['period']['end'],
+                                    resource.get('tenant_id'))
+                    if resource_key != key:
+                        if frame is not None:
+                            yield last_marker, frame
+                        key = resource_key
+                        frame = {'period': cur_frame['period'],
+                                 'usage': collections.OrderedDict()}
+                    frame['usage'].setdefault(service, []).append(resource)
+            last_marker = cur_marker
+        if frame is not None:
+            yield last_marker, frame
+
     def append(self, raw_data, tenant_id):
         """Append rated data before committing them to the backend.
 
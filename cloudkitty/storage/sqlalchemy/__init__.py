@@ -15,8 +15,10 @@
 #
 # @author: Stéphane Albert
 #
+import collections
 import json
 
+from oslo_config import cfg
 from oslo_db.sqlalchemy import utils
 import sqlalchemy
 
@@ -26,6 +28,25 @@ from cloudkitty.storage.sqlalchemy import migration
 from cloudkitty.storage.sqlalchemy import models
 from cloudkitty import utils as ck_utils
 
+sqlalchemy_storage_opts = [
+    cfg.IntOpt('insert_chunk_size',
+               default=1000,
+               help='Maximum number of rated frames written per insert '
+                    'statement.'),
+    cfg.IntOpt('fetch_chunk_size',
+               default=1000,
+               help='Number of rated frames fetched at once when reading '
+                    'time frames.'), ]
+
+cfg.CONF.register_opts(sqlalchemy_storage_opts, 'storage_sqlalchemy')
+
+# Rollup granularities, from the coarsest to the finest:
+# (name, bucket start, next bucket start, period alignment in seconds)
+ROLLUP_GRANULARITIES = (
+    ('month', ck_utils.get_month_start, ck_utils.get_next_month, 86400),
+    ('day', ck_utils.get_day_start, ck_utils.get_next_day, 86400),
+    ('hour', ck_utils.get_hour_start, ck_utils.get_next_hour, 3600))
+
 
 class SQLAlchemyStorage(storage.BaseStorage):
     """SQLAlchemy Storage Backend
@@ -34,6 +55,7 @@ class SQLAlchemyStorage(storage.BaseStorage):
     def __init__(self, period=3600):
         super(SQLAlchemyStorage, self).__init__(period)
         self._session = {}
+        self._frames = {}
 
     @staticmethod
     def init():
@@ -47,11 +69,86 @@ class SQLAlchemyStorage(storage.BaseStorage):
             self._append_time_frame('_NO_DATA_', empty_frame, tenant_id)
 
     def _commit(self, tenant_id):
+        self._update_rollups(tenant_id)
+        self._flush_frames(tenant_id)
+        self._update_tenant_state(tenant_id)
         self._session[tenant_id].commit()
 
     def _post_commit(self, tenant_id):
         super(SQLAlchemyStorage, self)._post_commit(tenant_id)
         del self._session[tenant_id]
+        self._frames.pop(tenant_id, None)
+
+    def _flush_frames(self, tenant_id):
+        """Bulk insert the buffered frames of a tenant.
+
+        :param tenant_id: tenant_id which frames must be written.
+        """
+        frames = self._frames.pop(tenant_id, [])
+        if not frames:
+            return
+        table = models.RatedDataFrame.__table__
+        chunk_size = cfg.CONF.storage_sqlalchemy.insert_chunk_size
+        session = self._session[tenant_id]
+        for idx in range(0, len(frames), chunk_size):
+            session.execute(table.insert(), frames[idx:idx + chunk_size])
+
+    def _update_rollups(self, tenant_id):
+        """Add the buffered frames of a tenant to the rollups.
+
+        :param tenant_id: tenant_id which rollups must be updated.
+        """
+        rollups = {}
+        for frame in self._frames.get(tenant_id, []):
+            for granularity, get_bucket, _, _ in ROLLUP_GRANULARITIES:
+                key = (granularity,
+                       frame['res_type'],
+                       get_bucket(frame['begin']))
+                rollups[key] = rollups.get(key, 0.0) + float(frame['rate'])
+        model = models.RatedDataRollup
+        session = self._session[tenant_id]
+        for key in sorted(rollups):
+            granularity, res_type, bucket = key
+            q = utils.model_query(
+                model,
+                session
+            ).filter(
+                model.granularity == granularity,
+                model.tenant_id == tenant_id,
+                model.res_type == res_type,
+                model.bucket == bucket
+            ).with_lockmode('update')
+            db_rollup = q.first()
+            if db_rollup is None:
+                session.add(model(granularity=granularity,
+                                  tenant_id=tenant_id,
+                                  res_type=res_type,
+                                  bucket=bucket,
+                                  rate=rollups[key]))
+            else:
+                db_rollup.rate += rollups[key]
+
+    def _update_tenant_state(self, tenant_id):
+        """Save the last committed period of a tenant.
+
+        :param tenant_id: tenant_id which state must be updated.
+        """
+        begin = self.usage_start_dt.get(tenant_id)
+        if tenant_id is None or begin is None:
+            return
+        session = self._session[tenant_id]
+        q = utils.model_query(
+            models.TenantState,
+            session
+        ).filter(
+            models.TenantState.tenant_id == tenant_id
+        ).with_lockmode('update')
+        db_state = q.first()
+        if db_state is None:
+            session.add(models.TenantState(tenant_id=tenant_id,
+                                           state=begin))
+        elif db_state.state < begin:
+            db_state.state = begin
 
     def _check_session(self, tenant_id):
         session = self._session.get(tenant_id)
@@ -68,43 +165,105 @@ class SQLAlchemyStorage(storage.BaseStorage):
 
     def get_state(self, tenant_id=None):
         session = db.get_session()
-        q = utils.model_query(
-            models.RatedDataFrame,
-            session
-        )
+        model = models.TenantState
         if tenant_id:
-            q = q.filter(
-                models.RatedDataFrame.tenant_id == tenant_id
+            q = utils.model_query(
+                model,
+                session
+            ).filter(
+                model.tenant_id == tenant_id
             )
-        r = q.order_by(
-            models.RatedDataFrame.begin.desc()
-        ).first()
+            r = q.value(model.state)
+        else:
+            r = session.query(sqlalchemy.func.max(model.state)).scalar()
         if r:
-            return ck_utils.dt2ts(r.begin)
+            return ck_utils.dt2ts(r)
 
-    def get_total(self, begin=None, end=None, tenant_id=None, service=None):
-        model = models.RatedDataFrame
+    def _split_range(self, begin, end, granularities):
+        """Split a time range between rollups and raw frames.
 
-        # Boundary calculation
-        if not begin:
-            begin = ck_utils.get_month_start()
-        if not end:
-            end = ck_utils.get_next_month()
+        :return: List of (granularity, begin, end), granularity is None for
+        parts which must be computed from the raw frames.
+        """
+        if begin >= end:
+            return []
+        if not granularities:
+            return [(None, begin, end)]
+        granularity, get_bucket, get_next_bucket, _ = granularities[0]
+        first_bucket = get_bucket(begin)
+        if first_bucket != begin:
+            first_bucket = get_next_bucket(first_bucket)
+        last_bucket = get_bucket(end)
+        if first_bucket >= last_bucket:
+            return self._split_range(begin, end, granularities[1:])
+        parts = self._split_range(begin, first_bucket, granularities[1:])
+        parts.append((granularity, first_bucket, last_bucket))
+        parts.extend(self._split_range(last_bucket, end, granularities[1:]))
+        return parts
 
+    def _get_raw_total(self, begin, end, tenant_id=None, service=None):
+        model = models.RatedDataFrame
         session = db.get_session()
         q = session.query(
             sqlalchemy.func.sum(model.rate).label('rate'))
         if tenant_id:
             q = q.filter(
-                models.RatedDataFrame.tenant_id == tenant_id)
+                model.tenant_id == tenant_id)
         if service:
             q = q.filter(
-                models.RatedDataFrame.res_type == service)
+                model.res_type == service)
         q = q.filter(
             model.begin >= begin,
             model.end <= end)
-        rate = q.scalar()
-        return rate
+        return q.scalar()
+
+    def _get_rollup_total(self, granularity, begin, end, tenant_id=None,
+                          service=None):
+        model = models.RatedDataRollup
+        session = db.get_session()
+        q = session.query(
+            sqlalchemy.func.sum(model.rate).label('rate'))
+        q = q.filter(
+            model.granularity == granularity)
+        if tenant_id:
+            q = q.filter(
+                model.tenant_id == tenant_id)
+        if service:
+            q = q.filter(
+                model.res_type == service)
+        q = q.filter(
+            model.bucket >= begin,
+            model.bucket < end)
+        return q.scalar()
+
+    def get_total(self, begin=None, end=None, tenant_id=None, service=None):
+        # Boundary calculation
+        if not begin:
+            begin = ck_utils.get_month_start()
+        if not end:
+            end = ck_utils.get_next_month()
+
+        # Rollups can only be used if frames don't overlap buckets
+        granularities = [granularity
+                         for granularity in ROLLUP_GRANULARITIES
+                         if not granularity[3] % self._period]
+        total = None
+        for granularity, part_begin, part_end in self._split_range(
+                begin, end, granularities):
+            if granularity:
+                rate = self._get_rollup_total(granularity,
+                                              part_begin,
+                                              part_end,
+                                              tenant_id,
+                                              service)
+            else:
+                rate = self._get_raw_total(part_begin,
+                                           part_end,
+                                           tenant_id,
+                                           service)
+            if rate is not None:
+                total = rate if total is None else total + rate
+        return total
 
     def get_tenants(self, begin=None, end=None):
         model = models.RatedDataFrame
@@ -128,7 +287,8 @@ class SQLAlchemyStorage(storage.BaseStorage):
         )
         return [tenant.tenant_id for tenant in tenants]
 
-    def get_time_frame(self, begin, end, **filters):
+    def _time_frame_query(self, begin, end, limit=None, marker=None,
+                          **filters):
         model = models.RatedDataFrame
         session = db.get_session()
         q = utils.model_query(
@@ -143,11 +303,48 @@ class SQLAlchemyStorage(storage.BaseStorage):
                 q = q.filter(getattr(model, filter_name) == filter_value)
         if not filters.get('res_type'):
             q = q.filter(model.res_type != '_NO_DATA_')
-        count = q.count()
-        if not count:
+        if marker is not None:
+            q = q.filter(model.id > marker)
+        q = q.order_by(model.id)
+        if limit:
+            q = q.limit(limit)
+        return q.yield_per(cfg.CONF.storage_sqlalchemy.fetch_chunk_size)
+
+    def iter_time_frame(self, begin, end, limit=None, marker=None,
+                        **filters):
+        q = self._time_frame_query(begin, end, limit, marker, **filters)
+        for entry in q:
+            yield entry.id, entry.to_cloudkitty()
+
+    def iter_grouped_time_frame(self, begin, end, limit=None, marker=None,
+                                **filters):
+        # Rows stay in id order for the keyset pagination, only the
+        # adjacent rows of a period and tenant are merged.
+        q = self._time_frame_query(begin, end, limit, marker, **filters)
+        key = None
+        frame = None
+        last_id = None
+        for entry in q:
+            entry_key = (entry.begin, entry.end, entry.tenant_id)
+            if entry_key != key:
+                if frame is not None:
+                    yield last_id, frame
+                key = entry_key
+                frame = {'period': {'begin': ck_utils.dt2iso(entry.begin),
+                                    'end': ck_utils.dt2iso(entry.end)},
+                         'usage': collections.OrderedDict()}
+            frame['usage'].setdefault(entry.res_type, []).append(
+                entry.to_resource())
+            last_id = entry.id
+        if frame is not None:
+            yield last_id, frame
+
+    def get_time_frame(self, begin, end, **filters):
+        frames = [frame
+                  for _, frame in self.iter_time_frame(begin, end, **filters)]
+        if not frames:
             raise storage.NoTimeFrame()
-        r = q.all()
-        return [entry.to_cloudkitty() for entry in r]
+        return frames
 
     def _append_time_frame(self, res_type, frame, tenant_id):
         vol_dict = frame['vol']
@@ -169,13 +366,14 @@ class SQLAlchemyStorage(storage.BaseStorage):
                        rate, desc):
         """Create a new time frame.
 
+        The frame is buffered and written on commit.
         """
-        frame = models.RatedDataFrame(begin=begin,
-                                      end=end,
-                                      tenant_id=tenant_id,
-                                      unit=unit,
-                                      qty=qty,
-                                      res_type=res_type,
-                                      rate=rate,
-                                      desc=desc)
-        self._session[tenant_id].add(frame)
+        frame = {'begin': begin,
+                 'end': end,
+                 'tenant_id': tenant_id,
+                 'unit': unit,
+                 'qty': qty,
+                 'res_type': res_type,
+                 'rate': rate,
+                 'desc': desc}
+        self._frames.setdefault(tenant_id, []).append(frame)
@@ -0,0 +1,51 @@
+"""added indexes and tenant states
+
+Revision ID: 307430ab38e6
+Revises: 792b438b663
+Create Date: 2015-10-14 10:21:47.193412
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '307430ab38e6'
+down_revision = '792b438b663'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_rated_data_frames_tenant_id_begin',
+                    'rated_data_frames',
+                    ['tenant_id', 'begin'])
+    op.create_index('ix_rated_data_frames_begin_end_res_type',
+                    'rated_data_frames',
+                    ['begin', 'end', 'res_type'])
+    op.create_table('tenant_states',
+    sa.Column('tenant_id', sa.String(length=32), nullable=False),
+    sa.Column('state', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id'),
+    mysql_charset='utf8',
+    mysql_engine='InnoDB')
+    frames = sa.table('rated_data_frames',
+                      sa.column('tenant_id'),
+                      sa.column('begin'))
+    states = sa.table('tenant_states',
+                      sa.column('tenant_id'),
+                      sa.column('state'))
+    latest_frames = sa.select(
+        [frames.c.tenant_id, sa.func.max(frames.c.begin)]
+    ).where(
+        frames.c.tenant_id.isnot(None)
+    ).group_by(
+        frames.c.tenant_id)
+    op.execute(states.insert().from_select(['tenant_id', 'state'],
+                                           latest_frames))
+
+
+def downgrade():
+    op.drop_table('tenant_states')
+    op.drop_index('ix_rated_data_frames_begin_end_res_type',
+                  'rated_data_frames')
+    op.drop_index('ix_rated_data_frames_tenant_id_begin',
+                  'rated_data_frames')
@@ -0,0 +1,75 @@
+"""added rollups
+
+Revision ID: 4c2f20df7491
+Revises: 307430ab38e6
+Create Date: 2015-10-15 16:02:11.846203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c2f20df7491'
+down_revision = '307430ab38e6'
+
+from alembic import op
+import sqlalchemy as sa
+
+from cloudkitty import utils as ck_utils
+
+GRANULARITIES = (('month', ck_utils.get_month_start),
+                 ('day', ck_utils.get_day_start),
+                 ('hour', ck_utils.get_hour_start))
+
+
+def upgrade():
+    op.create_table('rated_data_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=16), nullable=False),
+    sa.Column('tenant_id', sa.String(length=32), nullable=True),
+    sa.Column('res_type', sa.String(length=255), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('rate', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('granularity', 'tenant_id', 'res_type', 'bucket',
+                        name='uniq_rated_data_rollup'),
+    mysql_charset='utf8',
+    mysql_engine='InnoDB')
+
+    # Build rollups from existing frames
+    frames = sa.table('rated_data_frames',
+                      sa.column('tenant_id', sa.String),
+                      sa.column('res_type', sa.String),
+                      sa.column('begin', sa.DateTime),
+                      sa.column('rate', sa.Float))
+    rollups_table = sa.table('rated_data_rollups',
+                             sa.column('granularity', sa.String),
+                             sa.column('tenant_id', sa.String),
+                             sa.column('res_type', sa.String),
+                             sa.column('bucket', sa.DateTime),
+                             sa.column('rate', sa.Float))
+    q = sa.select(
+        [frames.c.tenant_id,
+         frames.c.res_type,
+         frames.c.begin,
+         sa.func.sum(frames.c.rate)]
+    ).group_by(
+        frames.c.tenant_id,
+        frames.c.res_type,
+        frames.c.begin)
+    rollups = {}
+    for tenant_id, res_type, begin, rate in op.get_bind().execute(q):
+        for granularity, get_bucket in GRANULARITIES:
+            key = (granularity, tenant_id, res_type, get_bucket(begin))
+            rollups[key] = rollups.get(key, 0.0) + (rate or 0.0)
+    if rollups:
+        op.bulk_insert(rollups_table, [
+            {'granularity': granularity,
+             'tenant_id': tenant_id,
+             'res_type': res_type,
+             'bucket': bucket,
+             'rate': rate}
+            for (granularity, tenant_id, res_type, bucket), rate
+            in rollups.items()])
+
+
+def downgrade():
+    op.drop_table('rated_data_rollups')
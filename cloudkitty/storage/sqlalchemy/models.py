@@ -30,8 +30,16 @@ class RatedDataFrame(Base, models.ModelBase):
     """A rated data frame.
 
     """
-    __table_args__ = {'mysql_charset': "utf8",
-                      'mysql_engine': "InnoDB"}
+    __table_args__ = (
+        sqlalchemy.Index('ix_rated_data_frames_tenant_id_begin',
+                         'tenant_id',
+                         'begin'),
+        sqlalchemy.Index('ix_rated_data_frames_begin_end_res_type',
+                         'begin',
+                         'end',
+                         'res_type'),
+        {'mysql_charset': "utf8",
+         'mysql_engine': "InnoDB"},)
     __tablename__ = 'rated_data_frames'
 
     id = sqlalchemy.Column(sqlalchemy.Integer,
@@ -53,7 +61,7 @@ class RatedDataFrame(Base, models.ModelBase):
     desc = sqlalchemy.Column(sqlalchemy.Text(),
                              nullable=False)
 
-    def to_cloudkitty(self):
+    def to_resource(self):
         # Rating informations
         rating_dict = {}
         rating_dict['price'] = self.rate
@@ -69,6 +77,10 @@ class RatedDataFrame(Base, models.ModelBase):
         res_dict['desc'] = json.loads(self.desc)
         res_dict['vol'] = vol_dict
         res_dict['tenant_id'] = self.tenant_id
+        return res_dict
+
+    def to_cloudkitty(self):
+        res_dict = self.to_resource()
 
         # Add resource to the usage dict
         usage_dict = {}
@@ -84,3 +96,61 @@ class RatedDataFrame(Base, models.ModelBase):
         ck_dict['period'] = period_dict
         ck_dict['usage'] = usage_dict
         return ck_dict
+
+
+class TenantState(Base, models.ModelBase):
+    """Last processed period of a tenant.
+
+    """
+    __table_args__ = {'mysql_charset': "utf8",
+                      'mysql_engine': "InnoDB"}
+    __tablename__ = 'tenant_states'
+
+    tenant_id = sqlalchemy.Column(sqlalchemy.String(32),
+                                  primary_key=True)
+    state = sqlalchemy.Column(sqlalchemy.DateTime,
+                              nullable=False)
+
+    def __repr__(self):
+        return ('<TenantState[{tenant_id}]: '
+                'state={state}>').format(
+                    tenant_id=self.tenant_id,
+                    state=self.state)
+
+
+class RatedDataRollup(Base, models.ModelBase):
+    """Total rate of a tenant's service over a time bucket.
+
+    """
+    __table_args__ = (
+        sqlalchemy.UniqueConstraint('granularity',
+                                    'tenant_id',
+                                    'res_type',
+                                    'bucket',
+                                    name='uniq_rated_data_rollup'),
+        {'mysql_charset': "utf8",
+         'mysql_engine': "InnoDB"},)
+    __tablename__ = 'rated_data_rollups'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer,
+                           primary_key=True)
+    granularity = sqlalchemy.Column(sqlalchemy.String(16),
+                                    nullable=False)
+    tenant_id = sqlalchemy.Column(sqlalchemy.String(32),
+                                  nullable=True)
+    res_type = sqlalchemy.Column(sqlalchemy.String(255),
+                                 nullable=False)
+    bucket = sqlalchemy.Column(sqlalchemy.DateTime,
+                               nullable=False)
+    rate = sqlalchemy.Column(sqlalchemy.Float(),
+                             nullable=False)
+
+    def __repr__(self):
+        return ('<RatedDataRollup[{granularity}]: '
+                'tenant_id={tenant_id} res_type={res_type} '
+                'bucket={bucket} rate={rate}>').format(
+                    granularity=self.granularity,
+                    tenant_id=self.tenant_id,
+                    res_type=self.res_type,
+                    bucket=self.bucket,
+                    rate=self.rate)
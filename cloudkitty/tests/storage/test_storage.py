@@ -167,6 +167,22 @@ class StorageTest(tests.TestCase):
         self.storage.commit(self._tenant_id)
         self.assertNotIn(self._tenant_id, self.storage._session)
 
+    def test_buffer_frames_until_commit(self):
+        working_data = copy.deepcopy(samples.RATED_DATA)
+        self.storage.append([working_data[0]], self._tenant_id)
+        self.assertEqual(2, len(self.storage._frames[self._tenant_id]))
+        self.storage.commit(self._tenant_id)
+        self.assertNotIn(self._tenant_id, self.storage._frames)
+
+    def test_commit_frames_by_chunks(self):
+        self.conf.set_override('insert_chunk_size', 1, 'storage_sqlalchemy')
+        self.insert_data()
+        stored_data = self.storage.get_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END,
+            tenant_id=self._tenant_id)
+        self.assertEqual(samples.STORED_DATA, stored_data)
+
     def test_update_period_on_append(self):
         self.assertNotIn(self._tenant_id, self.storage.usage_start)
         self.assertNotIn(self._tenant_id, self.storage.usage_start_dt)
@@ -264,6 +280,53 @@ class StorageTest(tests.TestCase):
             end=samples.SECOND_PERIOD_END)
         self.assertEqual(3, len(data))
 
+    def test_iter_frame_with_limit_and_marker(self):
+        self.insert_different_data_two_tenants()
+        expected_data = self.storage.get_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END)
+        first_page = list(self.storage.iter_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END,
+            limit=2))
+        self.assertEqual(2, len(first_page))
+        marker = first_page[-1][0]
+        second_page = list(self.storage.iter_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END,
+            limit=2,
+            marker=marker))
+        self.assertEqual(1, len(second_page))
+        self.assertEqual(
+            expected_data,
+            [frame for _, frame in first_page + second_page])
+
+    def test_iter_grouped_frame(self):
+        self.insert_data()
+        frames = list(self.storage.iter_grouped_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END,
+            tenant_id=self._tenant_id))
+        self.assertEqual(2, len(frames))
+        expected_data = copy.deepcopy(samples.STORED_DATA)
+        expected_data[0]['usage'].update(expected_data.pop(1)['usage'])
+        self.assertEqual(expected_data, [frame for _, frame in frames])
+
+    def test_iter_grouped_frame_splits_tenants(self):
+        self.insert_data()
+        frames = list(self.storage.iter_grouped_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.FIRST_PERIOD_END))
+        self.assertEqual(2, len(frames))
+        for _, frame in frames:
+            self.assertEqual(['compute', 'image'], sorted(frame['usage']))
+
+    def test_iter_frame_without_data(self):
+        frames = list(self.storage.iter_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END))
+        self.assertEqual([], frames)
+
     # State
     def test_get_state_when_nothing_in_storage(self):
         state = self.storage.get_state()
@@ -290,6 +353,15 @@ class StorageTest(tests.TestCase):
         state = self.storage.get_state(self._tenant_id)
         self.assertEqual(samples.FIRST_PERIOD_BEGIN, state)
 
+    def test_state_does_not_move_backward(self):
+        working_data = copy.deepcopy(samples.RATED_DATA)
+        self.storage.append([working_data[1]], self._tenant_id)
+        self.storage.commit(self._tenant_id)
+        self.storage.append([working_data[0]], self._tenant_id)
+        self.storage.commit(self._tenant_id)
+        state = self.storage.get_state(self._tenant_id)
+        self.assertEqual(samples.SECOND_PERIOD_BEGIN, state)
+
     # Total
     def test_get_empty_total(self):
         self.insert_data()
@@ -337,6 +409,23 @@ class StorageTest(tests.TestCase):
         self.assertEqual(1.9473999999999998, total)
         self.assertEqual(2, patch_utcnow_mock.call_count)
 
+    def test_rollups_updated_on_commit(self):
+        self.insert_data()
+        total = self.storage._get_rollup_total(
+            'day',
+            ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN + 86400),
+            tenant_id=self._tenant_id,
+            service='compute')
+        self.assertEqual(0.84, total)
+
+    def test_get_total_with_unaligned_boundaries(self):
+        self.insert_data()
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN - 1800),
+            end=ck_utils.ts2dt(samples.SECOND_PERIOD_END + 1800))
+        self.assertEqual(1.9473999999999998, total)
+
     # Tenants
     def test_get_empty_tenant_with_nothing_in_storage(self):
         tenants = self.storage.get_tenants(
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import json
+import os
+import tempfile
+
+from keystoneclient import exceptions as ks_exceptions
+import mock
+
+from cloudkitty import collector
+from cloudkitty.collector import ceilometer
+from cloudkitty import tests
+from cloudkitty.transformer import ceilometer as ceilometer_transformer
+from cloudkitty.transformer import format as format_transformer
+from cloudkitty import utils as ck_utils
+
+PROJECT_ID = 'f266f30b11f246b589fd266f85eeec39'
+OTHER_PROJECT_ID = '4dfb25b0947c4f5481daf7b948c14187'
+START = 1420070400
+END = START + 3600
+
+
+class FakeResource(object):
+    def __init__(self, resource_id):
+        self.resource_id = resource_id
+        self.project_id = PROJECT_ID
+        self.user_id = '55b3379b949243009ee96972fbf51ed1'
+        self.metadata = {'display_name': resource_id,
+                         'flavor.name': 'm1.nano'}
+
+
+class FakeStat(object):
+    def __init__(self, resource_id, value=1, project_id=None):
+        self.groupby = {'resource_id': resource_id}
+        if project_id:
+            self.groupby['project_id'] = project_id
+        self.max = value
+
+
+class CeilometerResourceCacherTest(tests.TestCase):
+    def test_least_recently_used_evicted(self):
+        cacher = ceilometer.CeilometerResourceCacher(size=2)
+        cacher.add_resource_detail('compute', 'instance-1', {'id': 1})
+        cacher.add_resource_detail('compute', 'instance-2', {'id': 2})
+        cacher.get_resource_detail('compute', 'instance-1')
+        cacher.add_resource_detail('compute', 'instance-3', {'id': 3})
+        self.assertTrue(cacher.has_resource_detail('compute', 'instance-1'))
+        self.assertFalse(cacher.has_resource_detail('compute', 'instance-2'))
+        self.assertTrue(cacher.has_resource_detail('compute', 'instance-3'))
+
+    def test_size_bound_per_resource_type(self):
+        cacher = ceilometer.CeilometerResourceCacher(size=1)
+        cacher.add_resource_detail('compute', 'res-1', {})
+        cacher.add_resource_detail('image', 'res-2', {})
+        self.assertTrue(cacher.has_resource_detail('compute', 'res-1'))
+        self.assertTrue(cacher.has_resource_detail('image', 'res-2'))
+
+    @mock.patch.object(ceilometer.time, 'time')
+    def test_expired_resources_removed(self, time_mock):
+        cacher = ceilometer.CeilometerResourceCacher(ttl=60)
+        time_mock.return_value = 1000
+        cacher.add_resource_detail('compute', 'instance-1', {})
+        time_mock.return_value = 1059
+        self.assertTrue(cacher.has_resource_detail('compute', 'instance-1'))
+        time_mock.return_value = 1060
+        self.assertFalse(cacher.has_resource_detail('compute', 'instance-1'))
+        self.assertRaises(ceilometer.ResourceNotFound,
+                          cacher.get_resource_detail,
+                          'compute',
+                          'instance-1')
+
+    def test_hits_and_misses_counted(self):
+        cacher = ceilometer.CeilometerResourceCacher()
+        cacher.has_resource_detail('compute', 'instance-1')
+        cacher.add_resource_detail('compute', 'instance-1', {})
+        cacher.has_resource_detail('compute', 'instance-1')
+        cacher.has_resource_detail('compute', 'instance-1')
+        self.assertEqual({'hits': 2, 'misses': 1, 'entries': 1},
+                         cacher.get_stats())
+
+    def test_resources_kept_on_disk(self):
+        path = os.path.join(tempfile.mkdtemp(), 'resources')
+        cacher = ceilometer.CeilometerResourceCacher(path=path)
+        cacher.add_resource_detail('compute', 'instance-1', {'id': 1})
+        cacher.close()
+        cacher = ceilometer.CeilometerResourceCacher(path=path)
+        self.assertEqual({'id': 1},
+                         cacher.get_resource_detail('compute', 'instance-1'))
+        cacher.close()
+
+
+class MetricsDefinitionTest(tests.TestCase):
+    def write_metrics(self, metrics):
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.json')
+        with open(path, 'w') as metrics_file:
+            json.dump(metrics, metrics_file)
+        return path
+
+    def test_default_metrics(self):
+        metrics = ceilometer.load_metrics()
+        self.assertEqual(sorted(self.conf.collect.services),
+                         sorted(metrics))
+        self.assertEqual('network.tap',
+                         metrics['network.bw.in']['resource_type'])
+        self.assertEqual('compute', metrics['compute']['resource_type'])
+        self.assertIsNone(metrics['compute']['aggregate'])
+
+    def test_metrics_from_file(self):
+        path = self.write_metrics({
+            'memory': {'meter': 'memory', 'unit': 'MB', 'aggregate': 'avg'},
+            'image': {'meter': 'image.size', 'unit': 'GB', 'factor': 1e-9}})
+        metrics = ceilometer.load_metrics(path)
+        self.assertEqual('avg', metrics['memory']['aggregate'])
+        self.assertEqual('GB', metrics['image']['unit'])
+        self.assertIn('compute', metrics)
+
+    def test_invalid_metric_from_file(self):
+        path = self.write_metrics({'memory': {'unit': 'MB'}})
+        self.assertRaises(ceilometer.MetricDefinitionError,
+                          ceilometer.load_metrics,
+                          path)
+
+
+class CeilometerCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(CeilometerCollectorTest, self).setUp()
+        patcher = mock.patch.object(ceilometer.cclient, 'get_client')
+        self.conn = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        transformers = {
+            'CeilometerTransformer':
+                ceilometer_transformer.CeilometerTransformer(),
+            'CloudKittyFormatTransformer':
+                format_transformer.CloudKittyFormatTransformer()}
+        self.collector = ceilometer.CeilometerCollector(transformers,
+                                                        period=3600)
+
+    def test_resources_details_listed_in_one_request(self):
+        ids = ['instance-1', 'instance-2', 'instance-3']
+        self.conn.statistics.list.return_value = [FakeStat(i) for i in ids]
+        self.conn.resources.list.return_value = [FakeResource(i)
+                                                 for i in ids]
+        data = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(3, len(data['compute']))
+        self.assertEqual(1, self.conn.resources.list.call_count)
+        self.assertFalse(self.conn.resources.get.called)
+
+    def test_listing_shared_between_services(self):
+        self.conn.statistics.list.return_value = [FakeStat('res-1')]
+        self.conn.resources.list.return_value = [FakeResource('res-1')]
+        self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.collector.retrieve('network.floating', START, END, PROJECT_ID)
+        self.assertEqual(1, self.conn.resources.list.call_count)
+
+    def test_listings_kept_per_project(self):
+        self.conn.resources.list.return_value = [FakeResource('res-1')]
+        self.collector._list_resources(START, END, PROJECT_ID)
+        self.collector._list_resources(START, END, OTHER_PROJECT_ID)
+        listing = self.collector._list_resources(START, END, PROJECT_ID)
+        self.assertEqual(['res-1'], list(listing))
+        self.assertEqual(2, self.conn.resources.list.call_count)
+
+    def test_oldest_listing_dropped(self):
+        self.conn.resources.list.return_value = [FakeResource('res-1')]
+        size = ceilometer.RESOURCES_LISTING_CACHE_SIZE
+        for idx in range(size + 1):
+            self.collector._list_resources(START, END, 'project-%d' % idx)
+        self.assertEqual(size, len(self.collector._resources_listings))
+        self.assertNotIn((START, END, 'project-0'),
+                         self.collector._resources_listings)
+
+    @mock.patch.object(ceilometer.LOG, 'warn')
+    def test_truncated_listing_logged(self, warn_mock):
+        self.conn.statistics.list.return_value = [FakeStat('instance-1'),
+                                                  FakeStat('instance-2')]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        self.conn.resources.get.return_value = FakeResource('instance-2')
+        self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(1, warn_mock.call_count)
+
+    def prefetch_two_periods(self):
+        stats = [FakeStat('instance-1'), FakeStat('instance-2')]
+        stats[0].period_start = ck_utils.ts2iso(START)
+        stats[1].period_start = ck_utils.ts2iso(END)
+        self.conn.statistics.list.return_value = stats
+        self.conn.resources.list.return_value = [FakeResource('instance-1'),
+                                                 FakeResource('instance-2')]
+        self.collector.prefetch('compute', START, END + 3600, PROJECT_ID)
+
+    def test_prefetched_period_collected_twice(self):
+        self.prefetch_two_periods()
+        first = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        second = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(first, second)
+        self.assertEqual(
+            ['instance-1'],
+            [item['desc']['instance_id'] for item in first['compute']])
+        self.assertEqual(1, self.conn.statistics.list.call_count)
+
+    def test_prefetched_data_dropped_after_last_period(self):
+        self.prefetch_two_periods()
+        self.collector.retrieve('compute', END, END + 3600, PROJECT_ID)
+        self.assertEqual({}, self.collector._stats_cache)
+
+    def test_clear_prefetched(self):
+        self.prefetch_two_periods()
+        self.collector.prefetch('compute', START, END + 3600,
+                                OTHER_PROJECT_ID)
+        self.collector.clear_prefetched(PROJECT_ID)
+        self.assertEqual([('instance', OTHER_PROJECT_ID)],
+                         list(self.collector._stats_cache))
+
+    def test_missing_resources_fetched_one_by_one(self):
+        self.conn.statistics.list.return_value = [FakeStat('instance-1'),
+                                                  FakeStat('instance-2')]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        self.conn.resources.get.return_value = FakeResource('instance-2')
+        data = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(2, len(data['compute']))
+        self.conn.resources.get.assert_called_once_with('instance-2')
+
+    def test_cached_resources_not_requested(self):
+        self.conn.statistics.list.return_value = [FakeStat('instance-1')]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.collector.retrieve('compute', END, END + 3600, PROJECT_ID)
+        self.assertEqual(1, self.conn.resources.list.call_count)
+        self.assertFalse(self.conn.resources.get.called)
+
+    def test_more_resources_than_cache_size(self):
+        self.conf.set_override('cache_size', 2, 'ceilometer_collector')
+        self.collector._cacher = ceilometer.CeilometerResourceCacher()
+        ids = ['instance-1', 'instance-2', 'instance-3', 'instance-4']
+        self.conn.statistics.list.return_value = [FakeStat(i) for i in ids]
+        self.conn.resources.list.return_value = [FakeResource(i)
+                                                 for i in ids]
+        data = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(
+            ids,
+            [item['desc']['instance_id'] for item in data['compute']])
+        self.assertEqual(2, self.collector._cacher.get_stats()['entries'])
+
+    def test_resources_fetched_by_id_without_project(self):
+        self.conn.statistics.list.return_value = [FakeStat('instance-1')]
+        self.conn.resources.get.return_value = FakeResource('instance-1')
+        self.collector.retrieve('compute', START, END)
+        self.assertFalse(self.conn.resources.list.called)
+        self.conn.resources.get.assert_called_once_with('instance-1')
+
+    def test_resources_not_listed_fetched_concurrently(self):
+        ids = ['instance-1', 'instance-2', 'instance-3']
+        self.conn.statistics.list.return_value = [FakeStat(i) for i in ids]
+        self.conn.resources.get.side_effect = FakeResource
+        data = self.collector.retrieve('compute', START, END)
+        self.assertEqual(
+            ids,
+            [item['desc']['instance_id'] for item in data['compute']])
+        self.assertEqual(3, self.conn.resources.get.call_count)
+
+    @mock.patch.object(ceilometer.eventlet, 'sleep')
+    def test_request_retried_with_backoff(self, sleep_mock):
+        self.conn.statistics.list.side_effect = [
+            ks_exceptions.HttpServerError(),
+            ks_exceptions.RequestTimeout(),
+            [FakeStat('instance-1')]]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        data = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(1, len(data['compute']))
+        self.assertEqual([mock.call(1.0), mock.call(2.0)],
+                         sleep_mock.call_args_list)
+
+    @mock.patch.object(ceilometer.eventlet, 'sleep')
+    def test_request_fails_after_retries(self, sleep_mock):
+        self.conf.set_override('request_retries', 2, 'ceilometer_collector')
+        self.conn.statistics.list.side_effect = (
+            ks_exceptions.HttpServerError())
+        self.assertRaises(ks_exceptions.HttpServerError,
+                          self.collector.retrieve,
+                          'compute',
+                          START,
+                          END,
+                          PROJECT_ID)
+        self.assertEqual(3, self.conn.statistics.list.call_count)
+
+    @mock.patch.object(ceilometer.eventlet, 'sleep')
+    def test_client_errors_not_retried(self, sleep_mock):
+        self.conn.statistics.list.side_effect = ks_exceptions.NotFound()
+        self.assertRaises(ks_exceptions.NotFound,
+                          self.collector.retrieve,
+                          'compute',
+                          START,
+                          END,
+                          PROJECT_ID)
+        self.assertEqual(1, self.conn.statistics.list.call_count)
+        self.assertFalse(sleep_mock.called)
+
+    def test_statistics_shared_between_projects(self):
+        self.conf.set_override('collect_all_projects',
+                               True,
+                               'ceilometer_collector')
+        self.conn.statistics.list.return_value = [
+            FakeStat('instance-1', project_id=PROJECT_ID),
+            FakeStat('instance-2', project_id=OTHER_PROJECT_ID),
+            FakeStat('instance-3', project_id=OTHER_PROJECT_ID)]
+        self.conn.resources.list.return_value = [
+            FakeResource('instance-1'),
+            FakeResource('instance-2'),
+            FakeResource('instance-3')]
+        data = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertEqual(1, len(data['compute']))
+        data = self.collector.retrieve('compute', START, END, OTHER_PROJECT_ID)
+        self.assertEqual(2, len(data['compute']))
+        self.conn.statistics.list.assert_called_once_with(
+            meter_name='instance',
+            period=0,
+            q=self.collector._gen_time_filter(START, END),
+            groupby=['resource_id', 'project_id'])
+
+    def test_project_without_statistics_has_no_data(self):
+        self.conf.set_override('collect_all_projects',
+                               True,
+                               'ceilometer_collector')
+        self.conn.statistics.list.return_value = [
+            FakeStat('instance-1', project_id=OTHER_PROJECT_ID)]
+        self.assertRaises(collector.NoDataCollected,
+                          self.collector.retrieve,
+                          'compute',
+                          START,
+                          END,
+                          PROJECT_ID)
+
+    def test_network_bandwidth_converted_to_mb(self):
+        self.conn.statistics.list.return_value = [
+            FakeStat('tap-1', 2097152),
+            FakeStat('tap-2', 524288)]
+        self.conn.resources.list.return_value = [FakeResource('tap-1'),
+                                                 FakeResource('tap-2')]
+        data = self.collector.retrieve('network.bw.in', START, END, PROJECT_ID)
+        self.assertEqual(
+            [{'unit': 'MB', 'qty': 2.0}, {'unit': 'MB', 'qty': 0.5}],
+            [item['vol'] for item in data['network.bw.in']])
+
+    def test_volume_quantities_from_max(self):
+        self.conn.statistics.list.return_value = [FakeStat('volume-1', 20)]
+        self.conn.resources.list.return_value = [FakeResource('volume-1')]
+        self.collector.t_ceilometer = mock.Mock()
+        self.collector.t_ceilometer.strip_resource_data.return_value = {}
+        data = self.collector.retrieve('volume', START, END, PROJECT_ID)
+        self.assertEqual([{'desc': {}, 'vol': {'unit': 'GB', 'qty': 20}}],
+                         data['volume'])
+
+    def test_retrieve_user_defined_metric(self):
+        self.collector.metrics = ceilometer.load_metrics()
+        self.collector.metrics['memory'] = {
+            'meter': 'memory.usage',
+            'unit': 'GB',
+            'aggregate': 'max',
+            'factor': 1 / 1024.0,
+            'resource_type': 'compute',
+            'metadata': {'name': ['display_name']}}
+        self.conn.statistics.list.return_value = [FakeStat('instance-1',
+                                                           512)]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        self.assertTrue(self.collector.has_resource('memory'))
+        data = self.collector.retrieve('memory', START, END, PROJECT_ID)
+        self.assertEqual(
+            [{'desc': {'resource_id': 'instance-1',
+                       'project_id': PROJECT_ID,
+                       'user_id': '55b3379b949243009ee96972fbf51ed1',
+                       'name': 'instance-1'},
+              'vol': {'unit': 'GB', 'qty': 0.5}}],
+            data['memory'])
+
+    def test_user_defined_metadata_cached_apart(self):
+        self.collector.metrics = ceilometer.load_metrics()
+        self.collector.metrics['memory'] = {
+            'meter': 'memory.usage',
+            'unit': 'GB',
+            'aggregate': 'max',
+            'factor': 1 / 1024.0,
+            'resource_type': 'compute',
+            'metadata': {'name': ['display_name']}}
+        self.conn.statistics.list.return_value = [FakeStat('instance-1',
+                                                           512)]
+        self.conn.resources.list.return_value = [FakeResource('instance-1')]
+        memory = self.collector.retrieve('memory', START, END, PROJECT_ID)
+        compute = self.collector.retrieve('compute', START, END, PROJECT_ID)
+        self.assertNotIn('flavor', memory['memory'][0]['desc'])
+        self.assertEqual('instance-1',
+                         compute['compute'][0]['desc']['instance_id'])
+        self.assertEqual('m1.nano', compute['compute'][0]['desc']['flavor'])
+
+    def test_unknown_metric_not_retrieved(self):
+        self.assertFalse(self.collector.has_resource('memory'))
+        self.assertIsNone(
+            self.collector.retrieve('memory', START, END, PROJECT_ID))
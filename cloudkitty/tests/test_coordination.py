@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import datetime
+
+import mock
+
+from cloudkitty import coordination
+from cloudkitty import tests
+from cloudkitty import utils as ck_utils
+
+TENANTS = ['tenant-{}'.format(idx) for idx in range(100)]
+
+
+class HashRingTest(tests.TestCase):
+    def test_empty_ring(self):
+        ring = coordination.HashRing([])
+        self.assertIsNone(ring.get_member('tenant-0'))
+
+    def test_single_member_owns_everything(self):
+        ring = coordination.HashRing(['node1'])
+        for tenant in TENANTS:
+            self.assertEqual('node1', ring.get_member(tenant))
+
+    def test_stable_mapping(self):
+        ring = coordination.HashRing(['node1', 'node2', 'node3'])
+        other_ring = coordination.HashRing(['node3', 'node1', 'node2'])
+        for tenant in TENANTS:
+            self.assertEqual(ring.get_member(tenant),
+                             other_ring.get_member(tenant))
+
+    def test_only_leaving_member_keys_move(self):
+        ring = coordination.HashRing(['node1', 'node2', 'node3'])
+        smaller_ring = coordination.HashRing(['node1', 'node2'])
+        for tenant in TENANTS:
+            member = ring.get_member(tenant)
+            if member != 'node3':
+                self.assertEqual(member, smaller_ring.get_member(tenant))
+
+
+class TenantPartitionerTest(tests.TestCase):
+    def setUp(self):
+        super(TenantPartitionerTest, self).setUp()
+        self.node1 = coordination.TenantPartitioner('node1')
+        self.node2 = coordination.TenantPartitioner('node2')
+        self.node1.heartbeat()
+        self.node2.heartbeat()
+
+    def test_tenants_are_split_between_members(self):
+        node1_tenants = self.node1.filter_tenants(TENANTS)
+        node2_tenants = self.node2.filter_tenants(TENANTS)
+        self.assertEqual([], list(set(node1_tenants) & set(node2_tenants)))
+        self.assertEqual(sorted(TENANTS),
+                         sorted(node1_tenants + node2_tenants))
+        self.assertNotEqual([], node1_tenants)
+        self.assertNotEqual([], node2_tenants)
+
+    def test_rebalance_on_leave(self):
+        self.node2.stop()
+        self.assertEqual(['node1'], self.node1.get_members())
+        self.assertEqual(TENANTS, self.node1.filter_tenants(TENANTS))
+
+    def test_dead_member_is_ignored(self):
+        later = ck_utils.utcnow() + datetime.timedelta(
+            seconds=self.conf.orchestrator.member_timeout + 1)
+        with mock.patch.object(ck_utils, 'utcnow', return_value=later):
+            self.node1.heartbeat()
+            self.assertEqual(['node1'], self.node1.get_members())
+
+    def test_self_always_member(self):
+        node3 = coordination.TenantPartitioner('node3')
+        self.assertEqual(['node1', 'node2', 'node3'], node3.get_members())
+
+    def test_ownership_moves_on_join(self):
+        node1_tenants = self.node1.filter_tenants(TENANTS)
+        node3 = coordination.TenantPartitioner('node3')
+        node3.heartbeat()
+        moved = [tenant for tenant in node3.filter_tenants(TENANTS)
+                 if tenant in node1_tenants]
+        self.assertNotEqual([], moved)
+        # node1 only notices the new member once its ring is refreshed
+        self.assertTrue(self.node1.is_mine(moved[0]))
+        self.node1.refresh()
+        self.assertFalse(self.node1.is_mine(moved[0]))
+
+    def test_leased_tenant_is_not_shared(self):
+        self.assertTrue(self.node1.acquire(TENANTS[0]))
+        self.assertFalse(self.node2.acquire(TENANTS[0]))
+        # Acquiring again renews the lease
+        self.assertTrue(self.node1.acquire(TENANTS[0]))
+        self.node1.release(TENANTS[0])
+        self.assertTrue(self.node2.acquire(TENANTS[0]))
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(self.node1.acquire(TENANTS[0]))
+        later = ck_utils.utcnow() + datetime.timedelta(
+            seconds=self.conf.orchestrator.member_timeout + 1)
+        with mock.patch.object(ck_utils, 'utcnow', return_value=later):
+            self.assertTrue(self.node2.acquire(TENANTS[0]))
+
+    def test_heartbeat_renews_leases(self):
+        self.assertTrue(self.node1.acquire(TENANTS[0]))
+        later = ck_utils.utcnow() + datetime.timedelta(
+            seconds=self.conf.orchestrator.member_timeout - 1)
+        with mock.patch.object(ck_utils, 'utcnow', return_value=later):
+            self.node1.heartbeat()
+        much_later = later + datetime.timedelta(
+            seconds=self.conf.orchestrator.member_timeout - 1)
+        with mock.patch.object(ck_utils, 'utcnow', return_value=much_later):
+            self.assertFalse(self.node2.acquire(TENANTS[0]))
+
+    def test_stop_releases_leases(self):
+        self.assertTrue(self.node1.acquire(TENANTS[0]))
+        self.node1.stop()
+        self.assertTrue(self.node2.acquire(TENANTS[0]))
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import csv
+import decimal
+import json
+import os
+import tempfile
+
+import mock
+
+from cloudkitty import collector
+from cloudkitty.collector import columnar
+from cloudkitty.collector import fake
+from cloudkitty import tests
+from cloudkitty.transformer import format as format_transformer
+
+START = 1420070400
+END = START + 3600
+
+ROWS = [
+    (START, 'compute', {'instance_id': 'instance-1', 'flavor': 'm1.nano'},
+     {'unit': 'instance', 'qty': 1}),
+    (START, 'image', {'image_id': 'image-1'}, {'unit': 'MB', 'qty': 12}),
+    (START, 'compute', {'instance_id': 'instance-2', 'flavor': 'm1.tiny'},
+     {'unit': 'instance', 'qty': 1}),
+    (END, 'compute', {'instance_id': 'instance-1', 'flavor': 'm1.nano'},
+     {'unit': 'instance', 'qty': 1}),
+]
+
+
+def write_csv(path, rows):
+    with open(path, 'w') as csvfile:
+        writer = csv.DictWriter(csvfile,
+                                ['begin', 'end', 'type', 'desc', 'vol'])
+        writer.writeheader()
+        for begin, res_type, desc, vol in rows:
+            writer.writerow({'begin': begin,
+                             'end': begin + 3600,
+                             'type': res_type,
+                             'desc': json.dumps(desc),
+                             'vol': json.dumps(vol)})
+
+
+class CSVCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(CSVCollectorTest, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'input.csv')
+        write_csv(self.path, ROWS)
+        self.conf.set_override('file', self.path, 'fake_collector')
+        self.transformers = {
+            'CloudKittyFormatTransformer':
+                format_transformer.CloudKittyFormatTransformer()}
+        self.collector = fake.CSVCollector(self.transformers, period=3600)
+
+    def test_retrieve_matching_rows(self):
+        data = self.collector.get_compute(START, END)
+        self.assertEqual(
+            ['instance-1', 'instance-2'],
+            [item['desc']['instance_id'] for item in data['compute']])
+        data = self.collector.get_image(START, END)
+        self.assertEqual([{'desc': {'image_id': 'image-1'},
+                           'vol': {'unit': 'MB', 'qty': 12}}],
+                         data['image'])
+
+    def test_no_matching_rows(self):
+        self.assertRaises(collector.NoDataCollected,
+                          self.collector.get_volume,
+                          START,
+                          END)
+        self.assertRaises(collector.NoDataCollected,
+                          self.collector.get_image,
+                          END,
+                          END + 3600)
+
+    def test_contiguous_rows_merged(self):
+        self.collector._open_csv()
+        self.assertEqual(2, len(self.collector._index['%d:compute' % START]))
+        self.assertEqual(1, len(self.collector._index['%d:compute' % END]))
+
+    def test_index_saved_and_reused(self):
+        self.collector.get_compute(START, END)
+        self.assertTrue(os.path.exists(self.path + '.idx'))
+        new_collector = fake.CSVCollector(self.transformers, period=3600)
+        with mock.patch.object(new_collector, '_build_index') as build_mock:
+            data = new_collector.get_compute(END, END + 3600)
+            self.assertFalse(build_mock.called)
+        self.assertEqual(1, len(data['compute']))
+
+    def test_index_rebuilt_when_file_changes(self):
+        self.collector.get_compute(START, END)
+        write_csv(self.path, ROWS[:1])
+        os.utime(self.path, (END, END))
+        data = self.collector.get_compute(START, END)
+        self.assertEqual(1, len(data['compute']))
+        self.assertRaises(collector.NoDataCollected,
+                          self.collector.get_compute,
+                          END,
+                          END + 3600)
+
+
+class ColumnarCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(ColumnarCollectorTest, self).setUp()
+        tmp_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(tmp_dir, 'input.csv')
+        write_csv(csv_path, ROWS)
+        self.columnar_path = os.path.join(tmp_dir, 'input.ckc')
+        columnar.convert_csv(csv_path, self.columnar_path)
+        self.conf.set_override('file', csv_path, 'fake_collector')
+        self.conf.set_override('columnar_file',
+                               self.columnar_path,
+                               'fake_collector')
+        transformers = {
+            'CloudKittyFormatTransformer':
+                format_transformer.CloudKittyFormatTransformer()}
+        self.collector = fake.ColumnarCollector(transformers, period=3600)
+
+    def test_retrieve_matching_rows(self):
+        data = self.collector.retrieve('compute', START, END)
+        self.assertEqual(
+            ['instance-1', 'instance-2'],
+            [item['desc']['instance_id'] for item in data['compute']])
+        data = self.collector.retrieve('image', START, END)
+        self.assertEqual([{'desc': {'image_id': 'image-1'},
+                           'vol': {'unit': 'MB', 'qty': 12}}],
+                         data['image'])
+
+    def test_same_items_as_csv_collector(self):
+        csv_collector = fake.CSVCollector(self.collector.transformers,
+                                          period=3600)
+        for res_type in ('compute', 'image'):
+            self.assertEqual(csv_collector.retrieve(res_type, START, END),
+                             self.collector.retrieve(res_type, START, END))
+        csv_collector.close()
+
+    def test_no_matching_rows(self):
+        self.assertRaises(collector.NoDataCollected,
+                          self.collector.retrieve,
+                          'image',
+                          END,
+                          END + 3600)
+
+    def test_services_from_file(self):
+        self.assertTrue(self.collector.has_resource('compute'))
+        self.assertTrue(self.collector.has_resource('image'))
+        self.assertFalse(self.collector.has_resource('volume'))
+        self.assertIsNone(self.collector.retrieve('volume', START, END))
+
+    def test_quantity_types_kept(self):
+        path = os.path.join(tempfile.mkdtemp(), 'types.ckc')
+        qtys = {'float': [0.5, 1.0],
+                'int': [1, 2],
+                'decimal': [decimal.Decimal('0.1'), decimal.Decimal('2')],
+                'mixed': [1, 0.5],
+                'big': [2 ** 60, 1]}
+        with columnar.ColumnarWriter(path) as writer:
+            for res_type, values in qtys.items():
+                writer.add_chunk(START, END, res_type, [
+                    {'desc': {}, 'vol': {'unit': 'unit', 'qty': qty}}
+                    for qty in values])
+        columnar_file = columnar.ColumnarFile(path)
+        for res_type, values in qtys.items():
+            items = columnar_file.get_items(START, res_type)
+            read_qtys = [item['vol']['qty'] for item in items]
+            self.assertEqual(values, read_qtys)
+            self.assertEqual([type(qty) for qty in values],
+                             [type(qty) for qty in read_qtys])
+        columnar_file.close()
+
+    def test_close_releases_files(self):
+        self.collector.retrieve('compute', START, END)
+        self.collector.close()
+        self.assertIsNone(self.collector._columnar)
+        # The file is opened again if the collector is used after close
+        data = self.collector.retrieve('compute', START, END)
+        self.assertEqual(2, len(data['compute']))
+
+    def test_descs_dictionary_encoded(self):
+        columnar_file = columnar.ColumnarFile(self.columnar_path)
+        self.assertEqual(3, len(columnar_file.descs))
+        self.assertEqual(['instance', 'MB'], columnar_file.units)
+        columns = columnar_file.get_columns(START, 'compute')
+        desc_ids, unit_ids, qtys = columns
+        self.assertEqual([0, 1], list(desc_ids))
+        self.assertEqual([0, 0], list(unit_ids))
+        self.assertEqual([1.0, 1.0], list(qtys))
+        self.assertIsNone(columnar_file.get_columns(START, 'volume'))
+        columnar_file.release_columns(columns)
+        columnar_file.close()
+
+    def test_close_with_columns_in_use(self):
+        columnar_file = columnar.ColumnarFile(self.columnar_path)
+        columns = columnar_file.get_columns(START, 'compute')
+        columnar_file.close()
+        self.assertEqual([1.0, 1.0], list(columns[2]))
+
+    def test_invalid_file(self):
+        with open(self.columnar_path, 'wb') as columnar_file:
+            columnar_file.write(b'not a columnar file')
+        self.assertRaises(columnar.InvalidColumnarFile,
+                          columnar.ColumnarFile,
+                          self.columnar_path)
@@ -87,6 +87,11 @@ class HashMapRatingTest(tests.TestCase):
         self._tenant_id = 'f266f30b11f246b589fd266f85eeec39'
         self._db_api = hash.HashMap.db_api
         self._db_api.get_migration().upgrade('head')
+        # Generations restart with every test database
+        patcher = mock.patch.dict(hash._RATES_CACHE,
+                                  {'generation': None, 'entries': {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self._hash = hash.HashMap(self._tenant_id)
 
     # Group tests
@@ -514,6 +519,68 @@ class HashMapRatingTest(tests.TestCase):
         self.assertEqual(expect,
                          self._hash._entries)
 
+    def test_load_rates_in_bulk(self):
+        self._generate_hashmap_rules()
+        with mock.patch.object(self._db_api, 'get_mapping') as get_mapping, \
+                mock.patch.object(self._db_api, 'get_threshold') as get_th, \
+                mock.patch.object(self._db_api, 'list_rates',
+                                  wraps=self._db_api.list_rates) as rates:
+            self._hash.reload_config()
+        rates.assert_called_once_with()
+        self.assertFalse(get_mapping.called)
+        self.assertFalse(get_th.called)
+
+    def test_rates_shared_between_instances(self):
+        self._generate_hashmap_rules()
+        first_hash = hash.HashMap(self._tenant_id)
+        with mock.patch.object(self._db_api, 'list_rates') as rates:
+            second_hash = hash.HashMap(self._tenant_id)
+        self.assertFalse(rates.called)
+        self.assertIs(first_hash._entries, second_hash._entries)
+
+    def test_rates_rebuilt_on_generation_change(self):
+        first_hash = hash.HashMap(self._tenant_id)
+        generation = self._db_api.get_generation()
+        self._db_api.create_service('compute')
+        self.assertEqual(generation + 1, self._db_api.get_generation())
+        second_hash = hash.HashMap(self._tenant_id)
+        self.assertEqual({}, first_hash._entries)
+        self.assertEqual({'compute': {'mappings': {}, 'thresholds': {}}},
+                         second_hash._entries)
+
+    def test_generation_not_bumped_on_error(self):
+        self._db_api.create_service('compute')
+        generation = self._db_api.get_generation()
+        self.assertRaises(api.ServiceAlreadyExists,
+                          self._db_api.create_service,
+                          'compute')
+        self.assertRaises(api.NoSuchService,
+                          self._db_api.delete_service,
+                          'image')
+        self.assertEqual(generation, self._db_api.get_generation())
+
+    def test_load_rates_without_group(self):
+        service_db = self._db_api.create_service('compute')
+        self._db_api.create_threshold(
+            level='2',
+            cost='0.1',
+            map_type='flat',
+            service_id=service_db.service_id)
+        self._db_api.create_service('image')
+        self._hash.reload_config()
+        expect = {
+            'compute': {
+                'mappings': {},
+                'thresholds': {
+                    '_DEFAULT_': {
+                        2: {
+                            'cost': decimal.Decimal('0.1'),
+                            'type': 'flat'}}}},
+            'image': {
+                'mappings': {},
+                'thresholds': {}}}
+        self.assertEqual(expect, self._hash._entries)
+
     def test_load_mappings(self):
         mapping_list = []
         service_db = self._db_api.create_service('compute')
@@ -695,6 +762,77 @@ class HashMapRatingTest(tests.TestCase):
         compute_list[2]['rating'] = {'price': decimal.Decimal('0.1')}
         self.assertEqual(expected_data, actual_data)
 
+    def test_process_mappings_lookup(self):
+        mapping_groups = {
+            '_DEFAULT_': {
+                'm1.nano': {'type': 'flat', 'cost': decimal.Decimal('1')},
+                'm1.tiny': {'type': 'flat', 'cost': decimal.Decimal('2')}},
+            'test_group': {
+                'm1.tiny': {'type': 'rate', 'cost': decimal.Decimal('1.5')},
+                '_DEFAULT_': {'type': 'rate',
+                              'cost': decimal.Decimal('1.1')}}}
+        self._hash.process_mappings(mapping_groups, 'm1.tiny')
+        self.assertEqual(2, self._hash._res['_DEFAULT_']['flat'])
+        self.assertEqual(decimal.Decimal('1.5'),
+                         self._hash._res['test_group']['rate'])
+        self._hash._res = {}
+        self._hash.process_mappings(mapping_groups, 'm1.large')
+        self.assertNotIn('_DEFAULT_', self._hash._res)
+        self.assertEqual(decimal.Decimal('1.1'),
+                         self._hash._res['test_group']['rate'])
+        self._hash._res = {}
+        self._hash.process_mappings(mapping_groups, {'unhashable': True})
+        self.assertEqual(decimal.Decimal('1.1'),
+                         self._hash._res['test_group']['rate'])
+
+    def test_threshold_group_find(self):
+        thresholds = hash.ThresholdGroup({
+            decimal.Decimal('128'): {'type': 'flat', 'cost': 2},
+            decimal.Decimal('64'): {'type': 'flat', 'cost': 1},
+            decimal.Decimal('512'): {'type': 'flat', 'cost': 3}})
+        self.assertEqual((None, None), thresholds.find(decimal.Decimal(32)))
+        self.assertEqual((64, {'type': 'flat', 'cost': 1}),
+                         thresholds.find(decimal.Decimal(64)))
+        self.assertEqual((128, {'type': 'flat', 'cost': 2}),
+                         thresholds.find(decimal.Decimal('511.9')))
+        self.assertEqual((512, {'type': 'flat', 'cost': 3}),
+                         thresholds.find(4096))
+
+    def test_thresholds_compiled_on_load(self):
+        self._generate_hashmap_rules()
+        self._hash.reload_config()
+        thresholds = self._hash._entries['compute']['fields']['memory'][
+            'thresholds']['test_group']
+        self.assertIsInstance(thresholds, hash.ThresholdGroup)
+        self.assertEqual([64, 128], thresholds.levels)
+
+    def test_process_thresholds_keeps_highest_level(self):
+        threshold_groups = {
+            'test_group': {
+                decimal.Decimal('64'): {'type': 'flat',
+                                        'cost': decimal.Decimal('0.1')},
+                decimal.Decimal('128'): {'type': 'rate',
+                                         'cost': decimal.Decimal('0.2')}}}
+        self._hash.update_result('test_group', 'flat', 1, 100, True)
+        self._hash.process_thresholds(threshold_groups,
+                                      decimal.Decimal('256'),
+                                      'service')
+        self.assertEqual({'level': 128,
+                          'cost': decimal.Decimal('0.2'),
+                          'type': 'rate',
+                          'scope': 'service'},
+                         self._hash._res['test_group']['threshold'])
+        self._hash._res = {}
+        self._hash.update_result('test_group', 'flat', 1, 100, True)
+        self._hash.process_thresholds(threshold_groups,
+                                      decimal.Decimal('127'),
+                                      'service')
+        self.assertEqual({'level': 100,
+                          'cost': 1,
+                          'type': 'flat',
+                          'scope': 'field'},
+                         self._hash._res['test_group']['threshold'])
+
     def test_update_result_flat(self):
         self._hash.update_result(
             'test_group',
@@ -827,3 +965,38 @@ class HashMapRatingTest(tests.TestCase):
         compute_list[2]['rating'] = {'price': decimal.Decimal('2.6357')}
         self._hash.process(actual_data)
         self.assertEqual(expected_data, actual_data)
+
+    def test_process_items_rates_identical_items_once(self):
+        service_db = self._db_api.create_service('compute')
+        flavor_db = self._db_api.create_field(service_db.service_id,
+                                              'flavor')
+        self._db_api.create_mapping(
+            value='m1.nano',
+            cost='1.337',
+            map_type='flat',
+            field_id=flavor_db.field_id)
+        self._hash.reload_config()
+        items = [
+            {'desc': {'flavor': 'm1.nano'},
+             'vol': {'unit': 'instance', 'qty': 1}},
+            {'desc': {'flavor': 'm1.nano'},
+             'vol': {'unit': 'instance', 'qty': 1}},
+            {'desc': {'flavor': 'm1.nano'},
+             'vol': {'unit': 'instance', 'qty': 2}},
+            {'desc': {'flavor': 'm1.nano'},
+             'vol': {'unit': 'instance', 'qty': decimal.Decimal('1.0')}},
+            {'desc': {'flavor': 'm1.tiny'},
+             'vol': {'unit': 'instance', 'qty': 1},
+             'rating': {'price': decimal.Decimal('0.1')}}]
+        with mock.patch.object(self._hash, 'process_fields',
+                               wraps=self._hash.process_fields) as fields:
+            self._hash.process_items('compute', items)
+        self.assertEqual(4, fields.call_count)
+        self.assertEqual(
+            [decimal.Decimal('1.337'),
+             decimal.Decimal('1.337'),
+             decimal.Decimal('2.674'),
+             decimal.Decimal('1.3370'),
+             decimal.Decimal('0.1')],
+            [item['rating']['price'] for item in items])
+        self.assertEqual('1.3370', str(items[3]['rating']['price']))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import mock
+from stevedore import extension
+
+from cloudkitty import collector
+from cloudkitty.collector import meta
+from cloudkitty.db import api as db_api
+from cloudkitty import tests
+
+START = 1420070400
+
+
+class FakeCollector1(collector.BaseCollector):
+    collector_name = 'fake1'
+    dependencies = tuple()
+
+    def get_compute(self, start, end=None, project_id=None, q_filter=None):
+        return {'compute': self.collector_name}
+
+    def get_image(self, start, end=None, project_id=None, q_filter=None):
+        return {'image': self.collector_name}
+
+
+class FakeCollector2(FakeCollector1):
+    collector_name = 'fake2'
+
+
+class MetaCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(MetaCollectorTest, self).setUp()
+        fake_extensions = [
+            extension.Extension('meta', None, meta.MetaCollector, None),
+            extension.Extension('fake1', None, FakeCollector1, None),
+            extension.Extension('fake2', None, FakeCollector2, None)]
+        patcher = mock.patch.object(
+            meta.extension,
+            'ExtensionManager',
+            return_value=extension.ExtensionManager.make_test_instance(
+                fake_extensions))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        conn = db_api.get_instance()
+        self.states = conn.get_module_enable_state()
+        self.states.set_state('collector_fake1', True)
+        self.states.set_state('collector_fake2', True)
+        self.db_mappings = conn.get_service_to_collector_mapping()
+
+    def get_collector(self):
+        return meta.MetaCollector([], period=3600)
+
+    def test_mapped_service_routed_to_mapped_collector(self):
+        self.db_mappings.set_mapping('compute', 'fake2')
+        self.db_mappings.set_mapping('image', 'fake1')
+        meta_collector = self.get_collector()
+        self.assertEqual({'compute': 'fake2'},
+                         meta_collector.retrieve('compute', START))
+        self.assertEqual({'image': 'fake1'},
+                         meta_collector.retrieve('image', START))
+
+    def test_mapping_to_disabled_collector_ignored(self):
+        self.states.set_state('collector_fake2', False)
+        self.db_mappings.set_mapping('compute', 'fake2')
+        meta_collector = self.get_collector()
+        self.assertEqual({'compute': 'fake1'},
+                         meta_collector.retrieve('compute', START))
+
+    def test_unknown_service_not_retrieved(self):
+        meta_collector = self.get_collector()
+        self.assertFalse(meta_collector.has_resource('volume'))
+        self.assertIsNone(meta_collector.retrieve('volume', START))
+
+    def test_routing_resolved_once(self):
+        meta_collector = self.get_collector()
+        with mock.patch.object(FakeCollector1, 'has_resource') as has_mock:
+            with mock.patch.object(FakeCollector2, 'has_resource') as has2:
+                meta_collector.retrieve('compute', START)
+                meta_collector.retrieve('compute', START + 3600)
+                self.assertFalse(has_mock.called)
+                self.assertFalse(has2.called)
+
+    def test_refresh_reloads_mappings(self):
+        self.db_mappings.set_mapping('compute', 'fake1')
+        meta_collector = self.get_collector()
+        self.assertEqual({'compute': 'fake1'},
+                         meta_collector.retrieve('compute', START))
+        self.db_mappings.set_mapping('compute', 'fake2')
+        self.assertEqual({'compute': 'fake1'},
+                         meta_collector.retrieve('compute', START))
+        meta_collector.refresh()
+        self.assertEqual({'compute': 'fake2'},
+                         meta_collector.retrieve('compute', START))
+
+    def test_refresh_keeps_enabled_collectors(self):
+        meta_collector = self.get_collector()
+        collectors = dict(meta_collector._collectors)
+        with mock.patch.object(FakeCollector1, 'close') as close_mock:
+            meta_collector.refresh()
+        self.assertEqual(collectors, meta_collector._collectors)
+        for name, cur_collector in collectors.items():
+            self.assertIs(cur_collector, meta_collector._collectors[name])
+        self.assertFalse(close_mock.called)
+
+    def test_refresh_closes_disabled_collectors(self):
+        meta_collector = self.get_collector()
+        fake2 = meta_collector._collectors['fake2']
+        self.states.set_state('collector_fake2', False)
+        with mock.patch.object(fake2, 'close') as close_mock:
+            meta_collector.refresh()
+        close_mock.assert_called_once_with()
+        self.assertEqual(['fake1'], list(meta_collector._collectors))
+        self.assertEqual({'compute': 'fake1'},
+                         meta_collector.retrieve('compute', START))
@@ -15,12 +15,15 @@
 #
 # @author: Stéphane Albert
 #
+import eventlet
 import mock
 from oslo_messaging import conffixture
 from stevedore import extension
 
+from cloudkitty import coordination
 from cloudkitty import orchestrator
 from cloudkitty import tests
+from cloudkitty import utils as ck_utils
 
 
 class FakeKeystoneClient(object):
@@ -88,3 +91,286 @@ class OrchestratorTest(tests.TestCase):
             self.assertEqual(2, worker._processors[1].obj.priority)
             self.assertEqual('fake2', worker._processors[2].name)
             self.assertEqual(1, worker._processors[2].obj.priority)
+
+
+class OrchestratorPoolTest(tests.TestCase):
+    def setUp(self):
+        super(OrchestratorPoolTest, self).setUp()
+        self.conf.set_override('max_workers', 2, 'orchestrator')
+        with mock.patch('stevedore.driver.DriverManager'), \
+                mock.patch.object(coordination, 'TenantPartitioner'), \
+                mock.patch.object(orchestrator.Orchestrator,
+                                  '_init_messaging'):
+            self.orchestrator = orchestrator.Orchestrator()
+
+    def test_pool_size_from_config(self):
+        self.assertEqual(2, self.orchestrator._pool.size)
+
+    def test_process_tenants_runs_every_due_tenant(self):
+        tenants = ['f266f30b11f246b589fd266f85eeec39',
+                   '4dfb25b0947c4f5481daf7b948c14187']
+        self.orchestrator._tenants = list(tenants)
+        check_state = mock.Mock(side_effect=[1, 1, 0, 0])
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               check_state), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        self.assertEqual([], self.orchestrator._tenants)
+        worker_mock.assert_has_calls([
+            mock.call(self.orchestrator.collector,
+                      self.orchestrator.storage,
+                      tenants[0],
+                      self.orchestrator.partitioner),
+            mock.call().run(),
+            mock.call(self.orchestrator.collector,
+                      self.orchestrator.storage,
+                      tenants[1],
+                      self.orchestrator.partitioner),
+            mock.call().run()])
+        self.orchestrator.partitioner.release.assert_has_calls([
+            mock.call(tenants[0]),
+            mock.call(tenants[1])])
+
+    def test_worker_error_does_not_stop_processing(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        check_state = mock.Mock(return_value=1)
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               check_state), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            worker_mock.return_value.run.side_effect = Exception('Boom')
+            self.orchestrator._process_tenants()
+        self.assertEqual([], self.orchestrator._tenants)
+        self.assertEqual(set(['f266f30b11f246b589fd266f85eeec39']),
+                         self.orchestrator._failed_tenants)
+
+    def test_leased_tenant_is_skipped(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        self.orchestrator.partitioner.acquire.return_value = False
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               return_value=1), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        self.assertFalse(worker_mock.called)
+        self.assertEqual([], self.orchestrator._tenants)
+        self.assertEqual(set(['f266f30b11f246b589fd266f85eeec39']),
+                         self.orchestrator._leased_tenants)
+        self.assertFalse(self.orchestrator.partitioner.release.called)
+
+    def test_lease_error_marks_tenant_as_failed(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        self.orchestrator.partitioner.acquire.side_effect = Exception('DB')
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               return_value=1), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        self.assertFalse(worker_mock.called)
+        self.assertEqual([], self.orchestrator._tenants)
+        self.assertEqual(set(['f266f30b11f246b589fd266f85eeec39']),
+                         self.orchestrator._failed_tenants)
+        self.assertFalse(self.orchestrator.partitioner.release.called)
+
+    def test_release_error_is_not_raised(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        self.orchestrator.partitioner.release.side_effect = Exception('DB')
+        check_state = mock.Mock(side_effect=[1, 0])
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               check_state), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        worker_mock.return_value.run.assert_called_once_with()
+        self.assertEqual([], self.orchestrator._tenants)
+        self.assertEqual(set(), self.orchestrator._failed_tenants)
+
+    def test_moved_tenant_is_dropped_from_the_pass(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        self.orchestrator.partitioner.is_mine.return_value = False
+        with mock.patch.object(self.orchestrator, '_check_state',
+                               return_value=1), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        self.assertFalse(worker_mock.called)
+        self.assertEqual([], self.orchestrator._tenants)
+
+    def test_terminate_stops_scheduling(self):
+        self.orchestrator._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        self.orchestrator.terminate()
+        with mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            self.orchestrator._process_tenants()
+        self.assertFalse(worker_mock.called)
+
+    def test_collector_refreshed_on_notification(self):
+        self.orchestrator.process_messages()
+        self.assertFalse(self.orchestrator.collector.refresh.called)
+        self.orchestrator._collector_endpoint.refresh({})
+        self.orchestrator.process_messages()
+        self.orchestrator.process_messages()
+        self.orchestrator.collector.refresh.assert_called_once_with()
+
+    def test_collector_refresh_error_does_not_stop_processing(self):
+        self.orchestrator.collector.refresh.side_effect = Exception('Boom')
+        self.orchestrator._collector_endpoint.refresh({})
+        self.orchestrator.process_messages()
+        self.orchestrator.collector.refresh.assert_called_once_with()
+
+
+class OrchestratorSchedulingTest(tests.TestCase):
+    def setUp(self):
+        super(OrchestratorSchedulingTest, self).setUp()
+        self.conf.set_override('period', 3600, 'collect')
+        self.conf.set_override('wait_periods', 2, 'collect')
+        with mock.patch('stevedore.driver.DriverManager'), \
+                mock.patch.object(coordination, 'TenantPartitioner'), \
+                mock.patch.object(orchestrator.Orchestrator,
+                                  '_init_messaging'):
+            self.orchestrator = orchestrator.Orchestrator()
+        self.orchestrator.storage = mock.MagicMock()
+        self.states = {}
+        self.orchestrator.storage.get_state.side_effect = self.states.get
+        self.orchestrator._managed_tenants = ['tenant1', 'tenant2']
+
+    def test_next_run_on_period_boundary_without_tenants(self):
+        self.orchestrator._managed_tenants = []
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=36100):
+            self.assertEqual(36000 + 3600 + 1,
+                             self.orchestrator._get_next_run())
+
+    def test_next_run_immediate_when_tenant_already_due(self):
+        # Next period (7200) is collectable after 7200 + 2 * 3600
+        self.states['tenant1'] = 3600
+        self.states['tenant2'] = 14400
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=20000):
+            self.assertEqual(7200 + 7200 + 1,
+                             self.orchestrator._get_next_run())
+            self.orchestrator._wait_next_run()
+
+    def test_next_run_ignores_failed_tenants(self):
+        self.states['tenant1'] = 3600
+        self.states['tenant2'] = 14400
+        self.orchestrator._failed_tenants.add('tenant1')
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=20000):
+            self.assertEqual(21601, self.orchestrator._get_next_run())
+
+    def test_next_run_retries_leased_tenants_after_heartbeat(self):
+        self.conf.set_override('heartbeat_interval', 30, 'orchestrator')
+        self.states['tenant1'] = 3600
+        self.states['tenant2'] = 14400
+        self.orchestrator._leased_tenants.add('tenant1')
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=20000):
+            self.assertEqual(20030, self.orchestrator._get_next_run())
+
+    def test_next_run_ignores_moved_tenants(self):
+        self.states['tenant1'] = 3600
+        self.states['tenant2'] = 14400
+        self.orchestrator.partitioner.is_mine.side_effect = (
+            lambda tenant: tenant != 'tenant1')
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=20000):
+            self.assertEqual(21601, self.orchestrator._get_next_run())
+
+    def test_check_state_records_lag(self):
+        self.states['tenant1'] = 3600
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=14421):
+            self.assertEqual(7200, self.orchestrator._check_state('tenant1'))
+        self.assertEqual(20, self.orchestrator.scheduling_lag.last)
+        self.assertEqual(1, self.orchestrator.scheduling_lag.count)
+
+    def test_check_state_not_due(self):
+        self.states['tenant1'] = 3600
+        with mock.patch.object(ck_utils, 'utcnow_ts', return_value=14400):
+            self.assertEqual(0, self.orchestrator._check_state('tenant1'))
+        self.assertEqual(0, self.orchestrator.scheduling_lag.count)
+
+
+class WorkerTest(tests.TestCase):
+    def setUp(self):
+        super(WorkerTest, self).setUp()
+        self.conf.set_override('max_service_workers', 3, 'orchestrator')
+        self.conf.set_override('services',
+                               ['compute', 'image', 'volume'],
+                               'collect')
+        self._tenant_id = 'f266f30b11f246b589fd266f85eeec39'
+        self.collector = mock.MagicMock()
+        self.storage = mock.MagicMock()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        with mock.patch(ck_ext_mgr, return_value=[]):
+            self.worker = orchestrator.Worker(self.collector,
+                                              self.storage,
+                                              self._tenant_id)
+
+    def test_services_are_written_in_order(self):
+        delays = {'compute': 0.03, 'image': 0.02, 'volume': 0.01}
+
+        def retrieve(service, start, end, tenant_id):
+            eventlet.sleep(delays[service])
+            return {service: []}
+
+        self.collector.retrieve.side_effect = retrieve
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 0]):
+            self.worker.run()
+        appended = [call[0][0][0]['usage']
+                    for call in self.storage.append.call_args_list]
+        self.assertEqual([{'compute': []}, {'image': []}, {'volume': []}],
+                         appended)
+        self.storage.commit.assert_called_once_with(self._tenant_id)
+
+    def test_failing_service_is_marked_as_nodata(self):
+        def retrieve(service, start, end, tenant_id):
+            if service == 'image':
+                raise Exception('Boom')
+            return {service: []}
+
+        self.collector.retrieve.side_effect = retrieve
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 0]):
+            self.worker.run()
+        self.assertEqual(2, self.storage.append.call_count)
+        self.storage.nodata.assert_called_once_with(
+            3600,
+            7200,
+            self._tenant_id)
+
+    def test_prefetch_when_late(self):
+        self.worker._catchup_periods = 24
+        self.collector.retrieve.return_value = {}
+        # Five periods are collectable from 3600
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 7200, 0]), \
+                mock.patch.object(ck_utils, 'utcnow_ts', return_value=28800):
+            self.worker.run()
+        self.collector.prefetch.assert_has_calls([
+            mock.call('compute', 3600, 21600, self._tenant_id),
+            mock.call('image', 3600, 21600, self._tenant_id),
+            mock.call('volume', 3600, 21600, self._tenant_id)])
+        self.assertEqual(3, self.collector.prefetch.call_count)
+        self.collector.clear_prefetched.assert_called_once_with(
+            self._tenant_id)
+
+    def test_prefetched_data_cleared_on_error(self):
+        self.worker._catchup_periods = 24
+        self.storage.commit.side_effect = Exception('Boom')
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 0]), \
+                mock.patch.object(ck_utils, 'utcnow_ts', return_value=28800):
+            self.assertRaises(Exception, self.worker.run)
+        self.collector.clear_prefetched.assert_called_once_with(
+            self._tenant_id)
+
+    def test_no_prefetch_when_disabled(self):
+        self.collector.retrieve.return_value = {}
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 0]), \
+                mock.patch.object(ck_utils, 'utcnow_ts', return_value=28800):
+            self.worker.run()
+        self.assertFalse(self.collector.prefetch.called)
+        self.assertFalse(self.collector.clear_prefetched.called)
+
+    def test_stops_when_tenant_moves(self):
+        partitioner = mock.MagicMock()
+        partitioner.is_mine.side_effect = [True, False]
+        self.worker._partitioner = partitioner
+        self.collector.retrieve.return_value = {}
+        with mock.patch.object(self.worker, 'check_state',
+                               side_effect=[3600, 7200, 0]):
+            self.worker.run()
+        partitioner.is_mine.assert_called_with(self._tenant_id)
+        self.storage.commit.assert_called_once_with(self._tenant_id)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+import decimal
+import os
+import tempfile
+
+import mock
+
+from cloudkitty import collector
+from cloudkitty.collector import replay
+from cloudkitty import tests
+
+TENANT = 'f266f30b11f246b589fd266f85eeec39'
+START = 1420070400
+END = START + 3600
+
+COMPUTE_DATA = {
+    'compute': [{
+        'desc': {'instance_id': 'instance-1', 'flavor': 'm1.nano'},
+        'vol': {'unit': 'instance', 'qty': 1}}]}
+
+
+class FakeCollector(tests.FakeCollectorModule):
+    def get_compute(self, start, end=None, project_id=None, q_filter=None):
+        return COMPUTE_DATA
+
+    def get_image(self, start, end=None, project_id=None, q_filter=None):
+        raise collector.NoDataCollected(self.collector_name, 'image')
+
+
+class ReplayCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(ReplayCollectorTest, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'recording.json.gz')
+        self.conf.set_override('file', self.path, 'replay_collector')
+        self.recorder = replay.RecordingCollector(FakeCollector(), self.path)
+
+    def get_replay_collector(self):
+        return replay.ReplayCollector([], period=3600)
+
+    def test_record_and_replay_data(self):
+        self.assertEqual(COMPUTE_DATA,
+                         self.recorder.retrieve('compute', START, END, TENANT))
+        replay_collector = self.get_replay_collector()
+        self.assertTrue(replay_collector.has_resource('compute'))
+        self.assertEqual(
+            COMPUTE_DATA,
+            replay_collector.retrieve('compute', START, END, TENANT))
+
+    def test_record_and_replay_no_data(self):
+        self.assertRaises(collector.NoDataCollected,
+                          self.recorder.retrieve,
+                          'image',
+                          START,
+                          END,
+                          TENANT)
+        replay_collector = self.get_replay_collector()
+        self.assertRaises(collector.NoDataCollected,
+                          replay_collector.retrieve,
+                          'image',
+                          START,
+                          END,
+                          TENANT)
+
+    def test_unrecorded_period_has_no_data(self):
+        self.recorder.retrieve('compute', START, END, TENANT)
+        replay_collector = self.get_replay_collector()
+        self.assertRaises(collector.NoDataCollected,
+                          replay_collector.retrieve,
+                          'compute',
+                          END,
+                          END + 3600,
+                          TENANT)
+
+    def test_replayed_data_not_shared_between_calls(self):
+        self.recorder.retrieve('compute', START, END, TENANT)
+        replay_collector = self.get_replay_collector()
+        first = replay_collector.retrieve('compute', START, END, TENANT)
+        first['compute'][0]['rating'] = {'price': 1}
+        first['compute'].pop()
+        self.assertEqual(
+            COMPUTE_DATA,
+            replay_collector.retrieve('compute', START, END, TENANT))
+
+    def test_unrecorded_resource_not_retrieved(self):
+        self.recorder.retrieve('compute', START, END, TENANT)
+        replay_collector = self.get_replay_collector()
+        self.assertFalse(replay_collector.has_resource('volume'))
+        self.assertRaises(collector.NoDataCollected,
+                          replay_collector.retrieve,
+                          'volume',
+                          START,
+                          END,
+                          TENANT)
+
+    def test_decimal_replayed_as_decimal(self):
+        data = {'compute': [{'desc': {},
+                             'vol': {'unit': 'instance',
+                                     'qty': decimal.Decimal('1.5')}}]}
+        with mock.patch.object(FakeCollector, 'get_compute',
+                               return_value=data):
+            self.recorder.retrieve('compute', START, END, TENANT)
+        replay_collector = self.get_replay_collector()
+        replayed = replay_collector.retrieve('compute', START, END, TENANT)
+        qty = replayed['compute'][0]['vol']['qty']
+        self.assertIsInstance(qty, decimal.Decimal)
+        self.assertEqual(decimal.Decimal('1.5'), qty)
+
+    @mock.patch.object(replay.eventlet, 'sleep')
+    def test_latency_injected(self, sleep_mock):
+        self.conf.set_override('latency', 0.25, 'replay_collector')
+        self.recorder.retrieve('compute', START, END, TENANT)
+        replay_collector = self.get_replay_collector()
+        replay_collector.retrieve('compute', START, END, TENANT)
+        sleep_mock.assert_called_once_with(0.25)
@@ -96,6 +96,26 @@ class UtilsTimeCalculationsTest(unittest.TestCase):
         self.assertEqual(date, trans_dt)
         patch_utcnow_mock.assert_called_once_with()
 
+    def test_get_hour_start(self):
+        base_date = datetime.datetime(**self.date_params)
+        date = datetime.datetime(2014, 11, 17, 10)
+        self.assertEqual(date, ck_utils.get_hour_start(base_date))
+
+    def test_get_next_hour(self):
+        base_date = datetime.datetime(2014, 12, 31, 23, 10, 15)
+        date = datetime.datetime(2015, 1, 1)
+        self.assertEqual(date, ck_utils.get_next_hour(base_date))
+
+    def test_get_day_start(self):
+        base_date = datetime.datetime(**self.date_params)
+        date = datetime.datetime(2014, 11, 17)
+        self.assertEqual(date, ck_utils.get_day_start(base_date))
+
+    def test_get_next_day_leap(self):
+        base_date = datetime.datetime(2016, 2, 28, 10, 10, 15)
+        date = datetime.datetime(2016, 2, 29)
+        self.assertEqual(date, ck_utils.get_next_day(base_date))
+
     def test_get_last_month_leap(self):
         base_date = datetime.datetime(2016, 3, 31)
         date = datetime.datetime(2016, 2, 1)
@@ -61,6 +61,25 @@ class CeilometerTransformer(transformer.BaseTransformer):
         res_data['size'] = data.metadata['size']
         return res_data
 
+    def strip_metadata(self, res_data, metadata_map):
+        """Strip resource data following a metadata map.
+
+        :param res_data: Ceilometer resource.
+        :param metadata_map: Dict mapping keys to a list of candidate
+                             metadata keys, the first one set is used.
+        """
+        stripped_data = {}
+        stripped_data['resource_id'] = res_data.resource_id
+        stripped_data['project_id'] = res_data.project_id
+        stripped_data['user_id'] = res_data.user_id
+
+        for key, meta_keys in six.iteritems(metadata_map):
+            for meta_key in meta_keys:
+                if stripped_data.get(key) is None:
+                    stripped_data[key] = res_data.metadata.get(meta_key)
+
+        return stripped_data
+
     def strip_resource_data(self, res_type, res_data):
         if res_type == 'compute':
             return self._strip_compute(res_data)
@@ -26,6 +26,16 @@ class CloudKittyFormatTransformer(transformer.BaseTransformer):
 
         return data
 
+    def format_items(self, descs, unit, qtys):
+        """Format several items sharing the same unit.
+
+        :param descs: List of items descriptions.
+        :param unit: Unit of every item.
+        :param qtys: List of quantities, in the same order as descs.
+        """
+        return [{'desc': desc, 'vol': {'unit': unit, 'qty': qty}}
+                for desc, qty in zip(descs, qtys)]
+
     def format_service(self, service, items):
         data = {}
         data[service] = items
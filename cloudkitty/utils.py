@@ -71,6 +71,26 @@ def utcnow_ts():
     return timeutils.utcnow_ts()
 
 
+def get_hour_start(dt=None):
+    if not dt:
+        dt = utcnow()
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def get_next_hour(dt=None):
+    return get_hour_start(dt) + datetime.timedelta(hours=1)
+
+
+def get_day_start(dt=None):
+    if not dt:
+        dt = utcnow()
+    return datetime.datetime(dt.year, dt.month, dt.day)
+
+
+def get_next_day(dt=None):
+    return get_day_start(dt) + datetime.timedelta(days=1)
+
+
 def get_month_days(dt):
     return calendar.monthrange(dt.year, dt.month)[1]
 
@@ -108,13 +108,15 @@ class WriteOrchestrator(object):
             writer.close()
 
     def _push_data(self):
-        data = self.get_timeframe(self.usage_start, self.usage_end)
-        if data:
-            for timeframe in data:
-                self._dispatch(timeframe['usage'])
-            return True
-        else:
-            return False
+        frames = self._storage.iter_grouped_time_frame(
+            self.usage_start,
+            self.usage_end,
+            tenant_id=self._tenant_id)
+        pushed = False
+        for _, timeframe in frames:
+            self._dispatch(timeframe['usage'])
+            pushed = True
+        return pushed
 
     def _commit_data(self):
         for backend in self._write_pipeline:
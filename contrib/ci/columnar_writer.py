@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+"""Convert a file generated by csv_writer.py to the columnar format."""
+import sys
+
+from cloudkitty.collector import columnar
+
+
+def main():
+    csv_filename = sys.argv[1] if len(sys.argv) > 1 else 'generated.csv'
+    filename = sys.argv[2] if len(sys.argv) > 2 else 'generated.ckc'
+    columnar.convert_csv(csv_filename, filename)
+
+
+if __name__ == '__main__':
+    main()